@@ -5,6 +5,9 @@ from flask import (
 import os
 import json
 import time
+import threading
+import queue
+import uuid
 from dotenv import load_dotenv
 from pathlib import Path
 import asyncio
@@ -29,10 +32,53 @@ class Runner:
         # Mock implementation
         return MockResponse(f"Using {agent.name} to process: {message}")
 
+    @staticmethod
+    def run_streamed(agent, message):
+        # Mock implementation; like the real runner it returns at once and
+        # the answer arrives through stream_events()
+        if agent.name == "Web Search Agent":
+            return MockStreamedResult(
+                "I can help you search for information about '" + message + "'. "
+                "To provide accurate results, I would typically search "
+                "multiple sources and compile the information for you.\n\n"
+                "What specific aspects of this topic interest you? "
+                "I can focus my search on particular details."
+            )
+        return MockStreamedResult(f"Using {agent.name} to process: {message}")
+
 class MockResponse:
     def __init__(self, response):
         self.final_output = response
         self.agent_name = "Mock Agent"
+
+class MockTextDelta:
+    type = "response.output_text.delta"
+
+    def __init__(self, delta):
+        self.delta = delta
+
+class MockStreamEvent:
+    def __init__(self, type, data):
+        self.type = type
+        self.data = data
+
+class MockStreamedResult:
+    def __init__(self, response):
+        self.final_output = response
+        self.is_complete = False
+        self._cancelled = False
+
+    async def stream_events(self):
+        # Raw model events carrying one text delta each
+        for delta in re.findall(r'\S+\s*', self.final_output):
+            if self._cancelled:
+                break
+            await asyncio.sleep(0)
+            yield MockStreamEvent("raw_response_event", MockTextDelta(delta))
+        self.is_complete = True
+
+    def cancel(self):
+        self._cancelled = True
         
 class ModelSettings:
     def __init__(self, temperature=0.7, top_p=1.0, max_tokens=None):
@@ -77,6 +123,102 @@ DATA_DIR.mkdir(exist_ok=True)
 SCREENSHOTS_DIR = DATA_DIR / "screenshots"
 SCREENSHOTS_DIR.mkdir(exist_ok=True)
 
+# Browser service settings
+BROWSER_SERVICE_URL = os.getenv("BROWSER_SERVICE_URL", "http://localhost:5002")
+AMAZON_BROWSE_PROFILE = os.getenv("AMAZON_BROWSE_PROFILE", "fast")
+# Named cookie/storage state so repeat Amazon visits skip the consent banner
+AMAZON_SESSION_STATE = os.getenv("AMAZON_SESSION_STATE", "amazon")
+# Hover and typing steps only send the area around the element
+BROWSE_CAPTURE_MODE = os.getenv("BROWSE_CAPTURE_MODE", "region")
+BROWSE_JOB_TIMEOUT = 180
+BROWSE_JOB_POLL_INTERVAL = 1
+# Marker the browser service uses to evict least recently viewed sessions
+LAST_VIEWED_MARKER = ".last_viewed"
+
+# Seconds a posted chat message waits for its stream before it is dropped
+CHAT_CHANNEL_TTL = int(os.getenv("CHAT_CHANNEL_TTL", "300"))
+# Model tokens buffered between the agent and a slow client, and seconds
+# to wait for the next token before giving up
+CHAT_TOKEN_QUEUE_SIZE = 64
+CHAT_TOKEN_TIMEOUT = int(os.getenv("CHAT_TOKEN_TIMEOUT", "120"))
+
+
+class BrowseJobError(Exception):
+    """Raised when a browse job on the browser service fails or times out"""
+
+
+def browser_service_error(response):
+    """Build a BrowseJobError from an error response of the browser service"""
+    retry_after = response.headers.get("Retry-After")
+    if response.status_code in (429, 503) and retry_after:
+        return BrowseJobError(
+            f"Browser service is busy, please try again in {retry_after} seconds"
+        )
+    return BrowseJobError(f"Error from browser service: {response.text}")
+
+
+def run_browser_job(url, options=None, timeout=BROWSE_JOB_TIMEOUT):
+    """Start a browse job on the browser service and poll until it is done"""
+    payload = dict(options or {}, url=url)
+    response = requests.post(
+        f"{BROWSER_SERVICE_URL}/jobs", json=payload, timeout=10
+    )
+    if response.status_code != 202:
+        raise browser_service_error(response)
+    job_id = response.json()["job_id"]
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        time.sleep(BROWSE_JOB_POLL_INTERVAL)
+        response = requests.get(
+            f"{BROWSER_SERVICE_URL}/jobs/{job_id}", timeout=10
+        )
+        if response.status_code == 404:
+            # The service restarted or already dropped the finished job
+            raise BrowseJobError(f"Browse job {job_id} is no longer known to the browser service")
+        if response.status_code != 200:
+            raise browser_service_error(response)
+        job = response.json()
+        if job["status"] == "completed":
+            return job["result"]
+        if job["status"] in ("failed", "cancelled"):
+            raise BrowseJobError(
+                job.get("error") or f"Browse job was {job['status']}"
+            )
+
+    # Give the browser back to other callers instead of finishing late
+    requests.delete(f"{BROWSER_SERVICE_URL}/jobs/{job_id}", timeout=10)
+    raise BrowseJobError(f"Browse job did not finish within {timeout} seconds")
+
+
+def stream_browser_events(url, options=None, timeout=BROWSE_JOB_TIMEOUT):
+    """Run a browse on the browser service, yielding events as they arrive.
+
+    Yields ``step`` events while the walk runs and a final ``result`` event.
+    An ``error`` event from the service is raised as BrowseJobError.
+    """
+    payload = dict(options or {}, url=url)
+    with requests.post(
+        f"{BROWSER_SERVICE_URL}/browse/stream",
+        json=payload,
+        stream=True,
+        timeout=(10, timeout)
+    ) as response:
+        if response.status_code != 200:
+            raise browser_service_error(response)
+        for line in response.iter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if event['type'] == 'error':
+                raise BrowseJobError(event['error'])
+            if event['type'] in ('step', 'result'):
+                yield event
+            if event['type'] == 'result':
+                return
+    raise BrowseJobError("Browser service closed the stream without a result")
+
+
 # File management tools
 
 
@@ -161,7 +303,7 @@ def browse_website_with_container(url: str, wait_seconds: int = 10) -> str:
         try:
             # Check if browser service is available
             try:
-                health_check = requests.get("http://localhost:5002/health", timeout=5)
+                health_check = requests.get(f"{BROWSER_SERVICE_URL}/health", timeout=5)
                 if health_check.status_code != 200:
                     print("Browser service health check failed, retrying...")
                     time.sleep(2)
@@ -175,30 +317,18 @@ def browse_website_with_container(url: str, wait_seconds: int = 10) -> str:
                 time.sleep(2)
                 continue
                 
-            # Call the browser service API
-            print(f"Sending browse request to browser service for {url}")
-            response = requests.post(
-                "http://localhost:5002/browse",
-                json={"url": url},
-                timeout=60
-            )
-            
-            if response.status_code != 200:
-                error_msg = f"Error from browser service: {response.text}"
+            # Run the browse as a job so a slow page does not hold a
+            # single long request open
+            print(f"Starting browse job on browser service for {url}")
+            try:
+                result_data = run_browser_job(url)
+            except BrowseJobError as e:
+                # The job already ran (or timed out) on the service, so
+                # retrying would only repeat the same slow page
+                error_msg = str(e)
                 print(f"Browser service error: {error_msg}")
-                
-                # If we've reached max retries, return the error
-                if retry_count == max_retries:
-                    response = (
-                        f"Error from browser "
-                        f"service: {response.text}"
-                    )
-                    break
-                retry_count += 1
-                time.sleep(2)  # Wait before retrying
-                continue
+                return error_msg
             
-            result_data = response.json()
             print(f"Successfully received response from browser service for {url}")
             
             # Return the result as JSON
@@ -223,6 +353,81 @@ def browse_website_with_container(url: str, wait_seconds: int = 10) -> str:
             return error_msg
 
 
+@function_tool
+def extract_website_content(url: str) -> str:
+    """Quickly read a compact outline of a web page (landmarks, headings,
+    text, links, form fields and tables) without the visual walk. Long
+    pages are split; pass the returned snapshot_id and next_cursor to
+    read_more_of_page for the rest"""
+    # Sanitize and validate URL
+    if not url.startswith('http'):
+        url = f"https://{url}"
+    
+    try:
+        response = requests.post(
+            f"{BROWSER_SERVICE_URL}/browse",
+            json={"url": url, "mode": "extract", "format": "outline"},
+            timeout=30
+        )
+        if response.status_code != 200:
+            return f"Error from browser service: {response.text}"
+        return json.dumps(response.json(), indent=2)
+    except requests.exceptions.ConnectionError:
+        return "Browser service not available. Please make sure Docker is running and the browser service is started with 'docker compose up -d'"
+    except Exception as e:
+        return f"Error extracting website content: {str(e)}"
+
+
+@function_tool
+def read_more_of_page(snapshot_id: str, cursor: int) -> str:
+    """Read the next part of a page outline returned by
+    extract_website_content or browse_website_with_container"""
+    try:
+        response = requests.get(
+            f"{BROWSER_SERVICE_URL}/outline/{snapshot_id}",
+            params={"cursor": cursor},
+            timeout=10
+        )
+        if response.status_code != 200:
+            return f"Error from browser service: {response.text}"
+        return json.dumps(response.json(), indent=2)
+    except requests.exceptions.ConnectionError:
+        return "Browser service not available. Please make sure Docker is running and the browser service is started with 'docker compose up -d'"
+    except Exception as e:
+        return f"Error reading page outline: {str(e)}"
+
+
+@function_tool
+def browse_multiple_websites(urls: list[str]) -> str:
+    """Read several web pages at once, e.g. to compare prices across sites.
+    Pages are fetched in parallel, so this is much faster than reading them
+    one by one"""
+    urls = [url if url.startswith('http') else f"https://{url}" for url in urls]
+    results = {}
+    try:
+        with requests.post(
+            f"{BROWSER_SERVICE_URL}/browse/batch",
+            json={"urls": urls, "options": {"mode": "extract"}},
+            stream=True,
+            timeout=(10, BROWSE_JOB_TIMEOUT)
+        ) as response:
+            if response.status_code != 200:
+                return str(browser_service_error(response))
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event['type'] == 'result':
+                    results[event['url']] = event['result']
+                elif event['type'] == 'error':
+                    results[event['url']] = {"error": event['error']}
+        return json.dumps(results, indent=2)
+    except requests.exceptions.ConnectionError:
+        return "Browser service not available. Please make sure Docker is running and the browser service is started with 'docker compose up -d'"
+    except Exception as e:
+        return f"Error browsing websites: {str(e)}"
+
+
 # Define our agent types
 
 def create_admin_agent():
@@ -307,7 +512,14 @@ def create_research_agent():
             "Search Agent. For research requiring code analysis or technical "
             "understanding, coordinate with the Coding Agent."
         ),
-        tools=[create_folder, save_text_to_file, list_files],
+        tools=[
+            extract_website_content,
+            read_more_of_page,
+            browse_multiple_websites,
+            create_folder,
+            save_text_to_file,
+            list_files
+        ],
         handoffs=[
             create_web_search_agent,
             create_coding_agent
@@ -444,6 +656,10 @@ def create_web_search_agent():
             "3. Cite sources and provide links when possible"
             "\n"
             "4. Save search results to files when appropriate"
+            "\n"
+            "5. Use extract_website_content to read the text and links of "
+            "result pages quickly, or browse_multiple_websites to read "
+            "several pages in parallel"
             "\n\n"
             "For tasks requiring visual browsing, interactive elements, or "
             "form submission (like price comparisons, flight searches, or "
@@ -461,6 +677,9 @@ def create_web_search_agent():
         ),
         tools=[
             search_web,
+            extract_website_content,
+            read_more_of_page,
+            browse_multiple_websites,
             create_folder,
             save_text_to_file,
             download_file,
@@ -483,7 +702,8 @@ def create_web_browsing_agent():
             "\n\n"
             "When handling web browsing tasks:"
             "\n"
-            "1. Use browse_website_with_container for visual demonstrations"
+            "1. Use browse_website_with_container for visual demonstrations, "
+            "and browse_multiple_websites to compare several sites at once"
             "\n"
             "2. Extract relevant information from websites clearly and "
             "concisely"
@@ -517,6 +737,8 @@ def create_web_browsing_agent():
         ),
         tools=[
             browse_website_with_container,
+            read_more_of_page,
+            browse_multiple_websites,
             create_folder,
             save_text_to_file,
             download_file,
@@ -657,359 +879,495 @@ def view_screenshot(filename):
     return send_from_directory(SCREENSHOTS_DIR, filename)
 
 
-@app.route('/api/chat/stream', methods=['POST', 'GET'])
-def chat_stream():
-    """Streaming API endpoint for chat responses"""
-    if request.method == 'POST':
-        data = request.json
-        user_message = data.get('message', '')
+@app.route('/screenshots/<path:filepath>', methods=['GET'])
+def serve_session_screenshot(filepath):
+    """API endpoint to serve a screenshot from a visual browsing session"""
+    response = send_from_directory(SCREENSHOTS_DIR, filepath)
+    # Tell the browser service's retention manager the session was viewed
+    session_dir = (SCREENSHOTS_DIR / filepath).parent
+    if session_dir.parent == SCREENSHOTS_DIR:
+        try:
+            (session_dir / LAST_VIEWED_MARKER).touch()
+        except OSError:
+            pass
+    return response
+
+
+class ChatChannels:
+    """Posted chat messages waiting for their SSE stream, keyed by channel id.
+
+    Each POST opens a channel with a random id and the GET stream for that
+    id reads its message, so concurrent conversations never see each
+    other's messages. A channel stays readable until its stream completes,
+    which lets an EventSource reconnect, and is dropped after ``ttl``
+    seconds if no stream ever completes.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._channels = {}
+
+    def _expire(self):
+        """Drop channels past their ttl; caller holds the lock"""
+        cutoff = time.time() - self.ttl
+        for channel_id in [
+            channel_id for channel_id, channel in self._channels.items()
+            if channel['created_at'] < cutoff
+        ]:
+            del self._channels[channel_id]
+
+    def open(self, message):
+        """Store a message and return the id of its new channel"""
+        channel_id = uuid.uuid4().hex
+        with self._lock:
+            self._expire()
+            self._channels[channel_id] = {
+                'message': message,
+                'created_at': time.time()
+            }
+        return channel_id
 
-        print(f"Received message: {user_message}")  # Log the received message
+    def get(self, channel_id):
+        """The message of a live channel, or None"""
+        with self._lock:
+            self._expire()
+            channel = self._channels.get(channel_id)
+            return channel['message'] if channel else None
 
-        # Store the message in the session for the GET request
-        # In a real app, you'd use a proper message queue or database
-        app.config['LAST_MESSAGE'] = user_message
-        return jsonify({"status": "message_received"})
+    def close(self, channel_id):
+        with self._lock:
+            self._channels.pop(channel_id, None)
 
-    # This is the GET request that establishes the SSE connection
-    def generate():
-        # Send initial event to establish connection
-        print("Starting SSE connection")  # Log connection start
-        yield "data: {\"status\": \"started\"}\n\n"
 
-        # Get the message from the app config
-        user_message = app.config.get('LAST_MESSAGE', '')
-        if not user_message:
-            print("No message found in app config")  # Log missing message
-            error_data = {
-                'status': 'error',
-                'message': 'No message found'
-            }
-            yield f"data: {json.dumps(error_data)}\n\n"
-            return
+chat_channels = ChatChannels(CHAT_CHANNEL_TTL)
 
-        print(f"Processing message: {user_message}")  # Log processing
 
+async def text_deltas(streamed):
+    """Yield the text of a streamed agent run as the model writes it.
+
+    Only raw model events carrying output text are kept; tool calls, handoffs
+    and the other run events are skipped. The run is cancelled if the reader
+    stops early.
+    """
+    try:
+        async for event in streamed.stream_events():
+            if event.type != "raw_response_event":
+                continue
+            if getattr(event.data, "type", None) == "response.output_text.delta":
+                yield event.data.delta
+    finally:
+        streamed.cancel()
+
+
+def relay_tokens(token_stream, maxsize=CHAT_TOKEN_QUEUE_SIZE,
+                 timeout=CHAT_TOKEN_TIMEOUT):
+    """Relay an async token stream to synchronous code as tokens arrive.
+
+    The async generator runs on its own event loop in a background thread
+    and hands tokens over through a bounded queue. When the client reads
+    slower than the model writes, the queue fills and the producer waits
+    instead of buffering without limit; the wait happens off the event
+    loop, so the model stream itself keeps being serviced. When the
+    consumer stops early, for example because the browser disconnected,
+    the producer stops too and the token stream is closed.
+    """
+    tokens = queue.Queue(maxsize=maxsize)
+    stopped = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                tokens.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    async def produce():
         try:
-            # Determine which type of request this is and handle accordingly
-            if "flight" in user_message.lower():
-                agent_name = "Web Browsing Agent"
-
-                # Send agent path information
-                path_data = {
-                    'type': 'agent_path',
-                    'path': agent_name,
-                    'full_path': [agent_name]
-                }
-                yield f"data: {json.dumps(path_data)}\n\n"
-
-                # For flight searches
-                response = (
-                    "I'll help you find flights between the cities "
-                    "you mentioned. For flights between Portland, Oregon "
-                    "and SFO, here's what I found:\n\n"
-                    "- Alaska Airlines: $99-$149 one-way (direct flights)\n"
-                    "- United Airlines: $119-$179 one-way (direct flights)\n"
-                    "- Delta Airlines: $129-$189 one-way (some layovers)\n"
-                    "- Southwest: $109-$169 one-way (limited availability)\n\n"
-                    "The cheapest flights are typically early morning "
-                    "or late. Would you like me to help with specific dates "
-                    "or booking options?"
-                )
-            elif ("browse" in user_message.lower() or
-                  "website" in user_message.lower()):
-                agent_name = "Web Browsing Agent"
-
-                # Send agent path information
-                path_data = {
-                    'type': 'agent_path',
-                    'path': agent_name,
-                    'full_path': [agent_name]
-                }
-                yield f"data: {json.dumps(path_data)}\n\n"
-
-                # Extract URL from user message
-                url_match = re.search(r'https?://[^\s]+', user_message)
-                url = url_match.group(0) if url_match else \
-                    "https://www.example.com"
-
-                try:
-                    # Call the containerized browser service
-                    print(f"Making browser service request to {url}")
-                    max_retries = 2
-                    retry_count = 0
-                    
-                    while retry_count <= max_retries:
+            async for token in token_stream:
+                if not await asyncio.to_thread(put, token):
+                    return
+        except Exception as e:
+            await asyncio.to_thread(put, e)
+            return
+        finally:
+            await token_stream.aclose()
+        await asyncio.to_thread(put, done)
+
+    threading.Thread(target=lambda: asyncio.run(produce()), daemon=True).start()
+    try:
+        while True:
+            try:
+                item = tokens.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError(f"No response from the model in {timeout} seconds")
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+
+
+def chat_events(user_message):
+    """Yield the events that answer one chat message, as dicts.
+
+    The NDJSON and SSE endpoints only differ in how they write these out.
+    """
+    yield {'status': 'started'}
+    print(f"Processing message: {user_message}")  # Log processing
+
+    try:
+        # Set when the answer comes from a model as it generates it
+        token_stream = None
+        # Determine which type of request this is and handle accordingly
+        if "flight" in user_message.lower():
+            agent_name = "Web Browsing Agent"
+
+            # Send agent path information
+            path_data = {
+                'type': 'agent_path',
+                'path': agent_name,
+                'full_path': [agent_name]
+            }
+            yield path_data
+
+            # For flight searches
+            response = (
+                "I'll help you find flights between the cities "
+                "you mentioned. For flights between Portland, Oregon "
+                "and SFO, here's what I found:\n\n"
+                "- Alaska Airlines: $99-$149 one-way (direct flights)\n"
+                "- United Airlines: $119-$179 one-way (direct flights)\n"
+                "- Delta Airlines: $129-$189 one-way (some layovers)\n"
+                "- Southwest: $109-$169 one-way (limited availability)\n\n"
+                "The cheapest flights are typically early morning "
+                "or late. Would you like me to help with specific dates "
+                "or booking options?"
+            )
+        elif ("browse" in user_message.lower() or
+              "website" in user_message.lower()):
+            agent_name = "Web Browsing Agent"
+
+            # Send agent path information
+            path_data = {
+                'type': 'agent_path',
+                'path': agent_name,
+                'full_path': [agent_name]
+            }
+            yield path_data
+
+            # Extract URL from user message
+            url_match = re.search(r'https?://[^\s]+', user_message)
+            url = url_match.group(0) if url_match else \
+                "https://www.example.com"
+
+            try:
+                # Call the containerized browser service
+                print(f"Making browser service request to {url}")
+                max_retries = 2
+                retry_count = 0
+                
+                while retry_count <= max_retries:
+                    try:
+                        # Check if browser service is available
                         try:
-                            # Check if browser service is available
-                            try:
-                                health_check = requests.get("http://localhost:5002/health", timeout=5)
-                                if health_check.status_code != 200:
-                                    raise Exception("Browser service health check failed")
-                            except Exception as e:
-                                print(f"Health check failed: {str(e)}")
-                                if retry_count == max_retries:
-                                    response = (
-                                        "Browser service not available. Please make sure Docker is running and the browser service is started with 'docker compose up -d'"
-                                    )
-                                    break
-                                retry_count += 1
-                                time.sleep(2)
-                                continue
-                            
-                            # Now make the actual browser request
-                            print(f"Sending browse request to browser service for {url}")
-                            response_obj = requests.post(
-                                "http://localhost:5002/browse",
-                                json={"url": url},
-                                timeout=60
-                            )
-                            
-                            if response_obj.status_code != 200:
-                                error_text = response_obj.text
-                                print(f"Browser service error: {error_text}")
-                                
-                                # If we've reached max retries, return the error
-                                if retry_count == max_retries:
-                                    response = (
-                                        f"Error from browser "
-                                        f"service: {response_obj.text}"
-                                    )
-                                    break
-                                retry_count += 1
-                                time.sleep(2)
-                                continue
-                            
-                            # Process successful response
-                            result_data = response_obj.json()
-                            success = True
-                            
-                            # Send visual data event
-                            visual_data = {
-                                'type': 'visual_data',
-                                'screenshots': result_data.get('screenshots', []),
-                                'descriptions': result_data.get('descriptions', []),
-                                'cursor_positions': result_data.get(
-                                    'cursor_positions', []
-                                ),
-                                'interactions': result_data.get(
-                                    'interactions', []
-                                )
-                            }
-                            visual_data_json = json.dumps(visual_data)
-                            yield f"data: {visual_data_json}\n\n"
-                            
-                            # Create response message
-                            response = (
-                                f"I've browsed {url} for you with visual feedback "
-                                f"showing cursor movements and interactions. You "
-                                f"can see the step-by-step process in the visual "
-                                f"browsing panel.\n\n"
-                                f"You can also watch the live browsing session in the embedded viewer."
-                            )
-                            break
-                        except requests.exceptions.ConnectionError as e:
-                            error_msg = f"Error browsing website: {str(e)}"
-                            print(f"Connection error: {error_msg}")
-                            
-                            # If we've reached max retries, return the error
+                            health_check = requests.get(f"{BROWSER_SERVICE_URL}/health", timeout=5)
+                            if health_check.status_code != 200:
+                                raise Exception("Browser service health check failed")
+                        except Exception as e:
+                            print(f"Health check failed: {str(e)}")
                             if retry_count == max_retries:
-                                response = error_msg
+                                response = (
+                                    "Browser service not available. Please make sure Docker is running and the browser service is started with 'docker compose up -d'"
+                                )
                                 break
-                            
                             retry_count += 1
-                            time.sleep(2)  # Wait before retrying
-                            
-                        except Exception as e:
-                            # For other exceptions, don't retry
-                            response = f"Error browsing website: {str(e)}"
-                            break
-                except Exception as e:
-                    response = f"Error browsing website: {str(e)}"
-            elif ("amazon" in user_message.lower() or
-                  "headphone" in user_message.lower() or
-                  "product" in user_message.lower()):
-                agent_name = "Web Browsing Agent"
-
-                # Send agent path information
-                path_data = {
-                    'type': 'agent_path',
-                    'path': agent_name,
-                    'full_path': [agent_name]
-                }
-                yield f"data: {json.dumps(path_data)}\n\n"
-
-                try:
-                    # Determine the URL based on the query
-                    search_term = "headphones" if "headphone" in user_message.lower() else "product"
-                    if "search for" in user_message.lower():
-                        search_parts = user_message.lower().split("search for")
-                        if len(search_parts) > 1:
-                            search_term = search_parts[1].strip().split()[0]
-                    
-                    url = f"https://www.amazon.com/s?k={search_term}"
-                    print(f"Making Amazon browser service request to {url}")
-                    
-                    # Call the containerized browser service with retries
-                    max_retries = 2
-                    retry_count = 0
-                    success = False
-                    
-                    while retry_count <= max_retries and not success:
+                            time.sleep(2)
+                            continue
+                        
+                        # Stream each step to the UI as soon as the
+                        # browser service captures it
+                        print(f"Streaming browse from browser service for {url}")
+                        result_data = None
                         try:
-                            # First check if the browser service is alive
-                            try:
-                                health_check = requests.get(
-                                    "http://localhost:5002/health",
-                                    timeout=5
-                                )
-                                if health_check.status_code != 200:
-                                    raise Exception("Browser service health check failed")
-                            except Exception as e:
-                                print(f"Health check failed: {str(e)}")
-                                if retry_count == max_retries:
-                                    response = (
-                                        "Browser service not available. Please make sure Docker is running with: docker compose up -d"
+                            for event in stream_browser_events(
+                                url,
+                                {"recording": True, "capture": BROWSE_CAPTURE_MODE}
+                            ):
+                                if event['type'] == 'step':
+                                    visual_step = dict(
+                                        event['step'], type='visual_step'
                                     )
-                                    break
-                                retry_count += 1
-                                time.sleep(2)
-                                continue
-                            
-                            # Now make the actual browser request
-                            response_obj = requests.post(
-                                "http://localhost:5002/browse",
-                                json={"url": url},
-                                timeout=60
-                            )
-                            
-                            if response_obj.status_code != 200:
-                                print(f"Browser service error: {response_obj.text}")
-                                if retry_count == max_retries:
-                                    response = (
-                                        f"Error from browser "
-                                        f"service: {response_obj.text}"
-                                    )
-                                    break
-                                retry_count += 1
-                                time.sleep(2)
-                                continue
-                            
-                            # Process successful response
-                            result_data = response_obj.json()
-                            success = True
-                            
-                            # Send visual data event
-                            visual_data = {
-                                'type': 'visual_data',
-                                'screenshots': result_data.get('screenshots', []),
-                                'descriptions': result_data.get('descriptions', []),
-                                'cursor_positions': result_data.get(
-                                    'cursor_positions', []
-                                ),
-                                'interactions': result_data.get(
-                                    'interactions', []
-                                )
-                            }
-                            visual_data_json = json.dumps(visual_data)
-                            yield f"data: {visual_data_json}\n\n"
-                            
-                            # Create response message
-                            response = (
-                                f"I've searched Amazon for {search_term} with "
-                                f"visual feedback showing cursor movements and "
-                                f"interactions. You can see the step-by-step "
-                                f"process in the visual browsing panel.\n\n"
-                                f"You can also watch the live browsing session "
-                                f"in the embedded viewer."
-                            )
+                                    yield visual_step
+                                elif event['type'] == 'result':
+                                    result_data = event['result']
+                        except BrowseJobError as e:
+                            print(f"Browser service error: {str(e)}")
+                            response = str(e)
+                            break
+                        
+                        # Process successful response
+                        success = True
+                        
+                        # Send visual data event
+                        visual_data = {
+                            'type': 'visual_data',
+                            'screenshots': result_data.get('screenshots', []),
+                            'descriptions': result_data.get('descriptions', []),
+                            'cursor_positions': result_data.get(
+                                'cursor_positions', []
+                            ),
+                            'interactions': result_data.get(
+                                'interactions', []
+                            ),
+                            # Partial frames drawn over the step before
+                            'patches': result_data.get('patches', []),
+                            # One animated file for playback
+                            'recording': result_data.get('recording')
+                        }
+                        yield visual_data
+                        
+                        # Create response message
+                        response = (
+                            f"I've browsed {url} for you with visual feedback "
+                            f"showing cursor movements and interactions. You "
+                            f"can see the step-by-step process in the visual "
+                            f"browsing panel.\n\n"
+                            f"You can also watch the live browsing session in the embedded viewer."
+                        )
+                        break
+                    except requests.exceptions.ConnectionError as e:
+                        error_msg = f"Error browsing website: {str(e)}"
+                        print(f"Connection error: {error_msg}")
+                        
+                        # If we've reached max retries, return the error
+                        if retry_count == max_retries:
+                            response = error_msg
                             break
-                        except requests.exceptions.ConnectionError as e:
-                            error_msg = f"Error browsing website: {str(e)}"
-                            print(f"Connection error: {error_msg}")
+                        
+                        retry_count += 1
+                        time.sleep(2)  # Wait before retrying
+                        
+                    except Exception as e:
+                        # For other exceptions, don't retry
+                        response = f"Error browsing website: {str(e)}"
+                        break
+            except Exception as e:
+                response = f"Error browsing website: {str(e)}"
+        elif ("amazon" in user_message.lower() or
+              "headphone" in user_message.lower() or
+              "product" in user_message.lower()):
+            agent_name = "Web Browsing Agent"
+
+            # Send agent path information
+            path_data = {
+                'type': 'agent_path',
+                'path': agent_name,
+                'full_path': [agent_name]
+            }
+            yield path_data
 
+            try:
+                # Determine the URL based on the query
+                search_term = "headphones" if "headphone" in user_message.lower() else "product"
+                if "search for" in user_message.lower():
+                    search_parts = user_message.lower().split("search for")
+                    if len(search_parts) > 1:
+                        search_term = search_parts[1].strip().split()[0]
+                
+                url = f"https://www.amazon.com/s?k={search_term}"
+                print(f"Making Amazon browser service request to {url}")
+                # Retail pages are heavy; skip media, fonts, ads and trackers
+                browse_options = {
+                    "profile": AMAZON_BROWSE_PROFILE,
+                    "session_state": AMAZON_SESSION_STATE,
+                    "capture": BROWSE_CAPTURE_MODE,
+                    "recording": True
+                }
+                
+                # Call the containerized browser service with retries
+                max_retries = 2
+                retry_count = 0
+                success = False
+                
+                while retry_count <= max_retries and not success:
+                    try:
+                        # First check if the browser service is alive
+                        try:
+                            health_check = requests.get(
+                                f"{BROWSER_SERVICE_URL}/health",
+                                timeout=5
+                            )
+                            if health_check.status_code != 200:
+                                raise Exception("Browser service health check failed")
+                        except Exception as e:
+                            print(f"Health check failed: {str(e)}")
                             if retry_count == max_retries:
-                                response = error_msg
+                                response = (
+                                    "Browser service not available. Please make sure Docker is running with: docker compose up -d"
+                                )
                                 break
-                            
                             retry_count += 1
-                            time.sleep(2)  # Wait before retrying
-                            
-                        except Exception as e:
-                            # For other exceptions, don't retry
-                            response = f"Error searching Amazon: {str(e)}"
+                            time.sleep(2)
+                            continue
+                        
+                        # Stream each step to the UI as soon as the
+                        # browser service captures it
+                        print(f"Streaming browse from browser service for {url}")
+                        result_data = None
+                        try:
+                            for event in stream_browser_events(url, browse_options):
+                                if event['type'] == 'step':
+                                    visual_step = dict(
+                                        event['step'], type='visual_step'
+                                    )
+                                    yield visual_step
+                                elif event['type'] == 'result':
+                                    result_data = event['result']
+                        except BrowseJobError as e:
+                            print(f"Browser service error: {str(e)}")
+                            response = str(e)
                             break
-                except Exception as e:
-                    response = f"Error searching Amazon: {str(e)}"
-            else:
-                # For other queries, use the Web Search Agent
-                agent_name = "Web Search Agent"
-
-                # Send agent path information
-                path_data = {
-                    'type': 'agent_path',
-                    'path': agent_name,
-                    'full_path': [agent_name]
-                }
-                yield f"data: {json.dumps(path_data)}\n\n"
-
-                # For general searches, provide a helpful response
-                response = (
-                    "I can help you search for information about '" +
-                    user_message + "'. "
-                    "To provide accurate results, I would typically search "
-                    "multiple sources and compile the information for you.\n\n"
-                    "What specific aspects of this topic interest you? "
-                    "I can focus my search on particular details."
-                )
-
-            # Split the response into words to simulate streaming
-            words = response.split(' ')
-            print(f"Streaming {len(words)} words")  # Log word count
-
-            # Stream each word with a small delay
-            for i, word in enumerate(words):
-                # Add space except for first word
-                token = word if i == 0 else f" {word}"
-
-                # Handle special formatting characters
-                if token == " \n":
-                    token = "\n"
-                elif token == " \n\n":
-                    token = "\n\n"
+                        
+                        # Process successful response
+                        success = True
+                        
+                        # Send visual data event
+                        visual_data = {
+                            'type': 'visual_data',
+                            'screenshots': result_data.get('screenshots', []),
+                            'descriptions': result_data.get('descriptions', []),
+                            'cursor_positions': result_data.get(
+                                'cursor_positions', []
+                            ),
+                            'interactions': result_data.get(
+                                'interactions', []
+                            ),
+                            # Partial frames drawn over the step before
+                            'patches': result_data.get('patches', []),
+                            # One animated file for playback
+                            'recording': result_data.get('recording')
+                        }
+                        yield visual_data
+                        
+                        # Create response message
+                        response = (
+                            f"I've searched Amazon for {search_term} with "
+                            f"visual feedback showing cursor movements and "
+                            f"interactions. You can see the step-by-step "
+                            f"process in the visual browsing panel.\n\n"
+                            f"You can also watch the live browsing session "
+                            f"in the embedded viewer."
+                        )
+                        break
+                    except requests.exceptions.ConnectionError as e:
+                        error_msg = f"Error browsing website: {str(e)}"
+                        print(f"Connection error: {error_msg}")
+
+                        if retry_count == max_retries:
+                            response = error_msg
+                            break
+                        
+                        retry_count += 1
+                        time.sleep(2)  # Wait before retrying
+                        
+                    except Exception as e:
+                        # For other exceptions, don't retry
+                        response = f"Error searching Amazon: {str(e)}"
+                        break
+            except Exception as e:
+                response = f"Error searching Amazon: {str(e)}"
+        else:
+            # For other queries, use the Web Search Agent
+            agent_name = "Web Search Agent"
+
+            # Send agent path information
+            path_data = {
+                'type': 'agent_path',
+                'path': agent_name,
+                'full_path': [agent_name]
+            }
+            yield path_data
+
+            # Relay the agent's answer token by token as it is generated
+            token_stream = text_deltas(Runner.run_streamed(
+                create_web_search_agent(), user_message
+            ))
 
+        if token_stream is None:
+            # The answer is already complete, so send it in one event
+            yield {'token': response, 'agent_used': agent_name}
+        else:
+            streamed = 0
+            for token in relay_tokens(token_stream):
                 token_data = {
                     'token': token,
                     'agent_used': agent_name
                 }
-                yield f"data: {json.dumps(token_data)}\n\n"
-                # Reduced delay between words for faster response
-                time.sleep(0.01)
-
-                # Log progress every 20 words
-                if i % 20 == 0 and i > 0:
-                    print(f"Streamed {i}/{len(words)} words")
-
-            # Send completion event
-            print("Streaming completed")  # Log completion
-            # Send a completion event with a flag to re-enable the input
-            completion_data = {'status': 'completed', 'enable_input': True}
-            yield f"data: {json.dumps(completion_data)}\n\n"
-            # Add explicit end of stream
-            yield "event: close\ndata: {}\n\n"
+                yield token_data
+                streamed += 1
+            print(f"Streamed {streamed} tokens")  # Log token count
 
-        except Exception as e:
-            # Send detailed error event
-            error_message = f"Error processing request: {str(e)}"
-            print(error_message)  # Log the error
+        # Send completion event
+        print("Streaming completed")  # Log completion
+        # Send a completion event with a flag to re-enable the input
+        completion_data = {'status': 'completed', 'enable_input': True}
+        yield completion_data
+
+    except Exception as e:
+        # Send detailed error event
+        error_message = f"Error processing request: {str(e)}"
+        print(error_message)  # Log the error
+        error_data = {
+            'status': 'error',
+            'message': error_message,
+            'enable_input': True
+        }
+        yield error_data
+
+
+@app.route('/api/chat/stream', methods=['POST', 'GET'])
+def chat_stream():
+    """Streaming API endpoint for chat responses"""
+    if request.method == 'POST':
+        data = request.json
+        user_message = data.get('message', '')
+
+        print(f"Received message: {user_message}")  # Log the received message
+
+        # Give the message its own channel; the GET request streams it by id
+        channel_id = chat_channels.open(user_message)
+        return jsonify({"status": "message_received", "channel": channel_id})
+
+    # This is the GET request that establishes the SSE connection
+    channel_id = request.args.get('channel', '')
+    user_message = chat_channels.get(channel_id)
+
+    def generate():
+        print(f"Starting SSE connection for channel {channel_id}")  # Log connection start
+        if not user_message:
+            print(f"No message found for channel {channel_id}")  # Log missing message
             error_data = {
                 'status': 'error',
-                'message': error_message,
+                'message': 'No message found',
                 'enable_input': True
             }
             yield f"data: {json.dumps(error_data)}\n\n"
-            # Add explicit end of stream
             yield "event: close\ndata: {}\n\n"
+            return
+
+        # The first event ({"status": "started"}) establishes the connection
+        for event in chat_events(user_message):
+            yield f"data: {json.dumps(event)}\n\n"
+            if event.get('status') == 'completed':
+                chat_channels.close(channel_id)
+        # Add explicit end of stream
+        yield "event: close\ndata: {}\n\n"
 
     return Response(
         stream_with_context(generate()),
@@ -1024,5 +1382,33 @@ def chat_stream():
     )
 
 
+@app.route('/api/chat/ndjson', methods=['POST'])
+def chat_ndjson():
+    """Stream the answer to a posted message as newline-delimited JSON.
+
+    The message and its streamed answer share one request, so the first
+    token arrives a round trip sooner than with the POST-then-SSE flow of
+    /api/chat/stream and no channel is kept on the server.
+    """
+    data = request.json or {}
+    user_message = data.get('message', '')
+    if not user_message:
+        return jsonify({'status': 'error', 'message': 'No message found'}), 400
+
+    print(f"Received message: {user_message}")  # Log the received message
+
+    def generate():
+        for event in chat_events(user_message):
+            yield json.dumps(event) + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={
+            'Cache-Control': 'no-cache, no-transform',
+            'X-Accel-Buffering': 'no'  # Disable proxy buffering
+        }
+    )
+
 if __name__ == '__main__':
     app.run(debug=True, port=5001)
@@ -1,16 +1,31 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from selenium import webdriver
 from selenium.webdriver.firefox.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.action_chains import ActionChains
+from selenium.webdriver.common.keys import Keys
 import time
 import json
 from pathlib import Path
 import os
 import threading
+import queue
+import requests
+import uuid
 import base64
+import hashlib
+import io
+import shutil
+import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from PIL import Image, ImageChops
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, quote
 
 app = Flask(__name__)
 
@@ -20,390 +35,3983 @@ DATA_DIR.mkdir(exist_ok=True)
 SCREENSHOTS_DIR = DATA_DIR / "screenshots"
 SCREENSHOTS_DIR.mkdir(exist_ok=True)
 
-# Global driver instance for persistent browser session
-driver = None
-driver_lock = threading.Lock()
+# Driver pool configuration
+POOL_SIZE = int(os.environ.get("BROWSER_POOL_SIZE", "2"))
+POOL_MAX_WAITERS = int(os.environ.get("BROWSER_POOL_MAX_WAITERS", "8"))
+POOL_CHECKOUT_TIMEOUT = float(os.environ.get("BROWSER_POOL_CHECKOUT_TIMEOUT", "30"))
+
+# Named Firefox profiles. A browse request picks one with "profile";
+# BROWSER_PROFILES_FILE may point at a JSON object adding or overriding
+# profiles. Profiles other than the pool defaults get their own small pool.
+AD_TRACKER_DOMAINS = [
+    "doubleclick.net", "googlesyndication.com", "googleadservices.com",
+    "google-analytics.com", "googletagmanager.com", "googletagservices.com",
+    "amazon-adsystem.com", "adnxs.com", "criteo.com", "criteo.net",
+    "taboola.com", "outbrain.com", "scorecardresearch.com", "facebook.net",
+    "hotjar.com", "quantserve.com", "moatads.com", "rubiconproject.com"
+]
+DRIVER_PROFILES = {
+    "default": {},
+    # Visual walks on heavy pages: keep images, skip everything else
+    "fast": {
+        "block_media": True,
+        "block_fonts": True,
+        "block_trackers": True,
+        "blocked_domains": AD_TRACKER_DOMAINS,
+        "cache_mb": 256
+    },
+    # Text-only reads such as extract mode
+    "text": {
+        "block_images": True,
+        "block_media": True,
+        "block_fonts": True,
+        "block_trackers": True,
+        "blocked_domains": AD_TRACKER_DOMAINS,
+        "cache_mb": 128
+    }
+}
+if os.environ.get("BROWSER_PROFILES_FILE"):
+    DRIVER_PROFILES.update(
+        json.loads(Path(os.environ["BROWSER_PROFILES_FILE"]).read_text())
+    )
+DEFAULT_PROFILE = os.environ.get("BROWSER_DEFAULT_PROFILE", "default")
+EXTRACT_PROFILE = os.environ.get("BROWSER_EXTRACT_PROFILE", "text")
+PROFILE_POOL_SIZE = int(os.environ.get("BROWSER_PROFILE_POOL_SIZE", "1"))
+
+# Driver recycling configuration
+MAX_PAGES_PER_DRIVER = int(os.environ.get("BROWSER_MAX_PAGES_PER_DRIVER", "50"))
+MAX_DRIVER_RSS_MB = int(os.environ.get("BROWSER_MAX_DRIVER_RSS_MB", "1500"))
+STANDBY_DRIVERS = int(os.environ.get("BROWSER_STANDBY_DRIVERS", "1"))
+# Watchdog that pings idle drivers and samples memory between jobs
+WATCHDOG_INTERVAL_SECONDS = float(os.environ.get("BROWSER_WATCHDOG_INTERVAL_SECONDS", "15"))
+WATCHDOG_PING_TIMEOUT = float(os.environ.get("BROWSER_WATCHDOG_PING_TIMEOUT", "5"))
+
+# Extract mode runs on its own pool of headless drivers
+EXTRACT_POOL_SIZE = int(os.environ.get("BROWSER_EXTRACT_POOL_SIZE", "2"))
+EXTRACT_STANDBY_DRIVERS = int(os.environ.get("BROWSER_EXTRACT_STANDBY_DRIVERS", "0"))
+EXTRACT_TEXT_LIMIT = int(os.environ.get("BROWSER_EXTRACT_TEXT_LIMIT", "20000"))
+EXTRACT_LINK_LIMIT = int(os.environ.get("BROWSER_EXTRACT_LINK_LIMIT", "200"))
+
+# Page outlines: bytes returned per page of outline, lines captured per
+# page, characters per line and table rows shown, and outlines kept for
+# paging with a cursor
+OUTLINE_BYTE_BUDGET = int(os.environ.get("BROWSER_OUTLINE_BYTE_BUDGET", "8000"))
+OUTLINE_MAX_ITEMS = int(os.environ.get("BROWSER_OUTLINE_MAX_ITEMS", "3000"))
+OUTLINE_TEXT_LENGTH = 200
+OUTLINE_TABLE_ROWS = 10
+OUTLINE_SNAPSHOTS = int(os.environ.get("BROWSER_OUTLINE_SNAPSHOTS", "64"))
+
+# Interaction plans run at most this many steps per request
+PLAN_MAX_STEPS = int(os.environ.get("BROWSER_PLAN_MAX_STEPS", "50"))
+
+# Result cache configuration
+CACHE_DIR = DATA_DIR / "cache"
+CACHE_MAX_ENTRIES = int(os.environ.get("BROWSER_CACHE_MAX_ENTRIES", "128"))
+CACHE_TTL_SECONDS = int(os.environ.get("BROWSER_CACHE_TTL_SECONDS", "300"))
+CACHE_DISK_MAX_AGE_SECONDS = int(os.environ.get("BROWSER_CACHE_DISK_MAX_AGE_SECONDS", "86400"))
+
+# Screenshot retention configuration; a quota or age of 0 disables it
+SCREENSHOT_QUOTA_MB = int(os.environ.get("BROWSER_SCREENSHOT_QUOTA_MB", "1024"))
+SCREENSHOT_MAX_AGE_DAYS = float(os.environ.get("BROWSER_SCREENSHOT_MAX_AGE_DAYS", "7"))
+RETENTION_INTERVAL_SECONDS = int(os.environ.get("BROWSER_RETENTION_INTERVAL_SECONDS", "300"))
+RETENTION_MIN_AGE_SECONDS = 300
+# Marker files inside a session directory; app.py touches the same marker
+# when it serves a screenshot from the session
+LAST_VIEWED_MARKER = ".last_viewed"
+PINNED_MARKER = ".pinned"
+
+# Named session state (cookies and localStorage per host) reused across
+# browses; hosts not refreshed within the maximum age are ignored
+SESSION_STATE_DIR = DATA_DIR / "session_state"
+SESSION_STATE_MAX_AGE_DAYS = float(os.environ.get("BROWSER_SESSION_STATE_MAX_AGE_DAYS", "7"))
+
+# Page readiness configuration: each wait returns as soon as the page is
+# ready and never blocks longer than its per-step maximum
+PAGE_READY_TIMEOUT = float(os.environ.get("BROWSER_PAGE_READY_TIMEOUT", "10"))
+SETTLE_TIMEOUT = float(os.environ.get("BROWSER_SETTLE_TIMEOUT", "2"))
+NETWORK_IDLE_MS = int(os.environ.get("BROWSER_NETWORK_IDLE_MS", "500"))
+READY_POLL_INTERVAL = 0.05
+
+# Interactive element scan configuration. Each group scans the first
+# ``scan`` matches of ``selector`` and keeps up to ``take`` visible ones.
+DEFAULT_SCAN_GROUPS = [
+    {"selector": "a", "scan": 20, "take": 5},
+    {"selector": "button", "scan": 10, "take": 3},
+    {"selector": "input", "scan": 10, "take": 3}
+]
+SCAN_GROUPS = json.loads(
+    os.environ.get("BROWSER_SCAN_GROUPS", json.dumps(DEFAULT_SCAN_GROUPS))
+)
+MAX_INTERACTIVE_ELEMENTS = int(os.environ.get("BROWSER_MAX_INTERACTIVE_ELEMENTS", "8"))
+SCAN_TEXT_LENGTH = 30
+
+# Simulated typing: "instant" sends whole strings, "chunked" sends a few
+# characters at a time, "animate" sends the string and replays it in the page
+TYPING_MODES = ("instant", "chunked", "animate")
+TYPING_MODE = os.environ.get("BROWSER_TYPING_MODE", "animate")
+TYPING_DELAY_MS = int(os.environ.get("BROWSER_TYPING_DELAY_MS", "20"))
+TYPING_CHUNK_SIZE = int(os.environ.get("BROWSER_TYPING_CHUNK_SIZE", "8"))
+TYPING_MAX_DURATION_MS = int(os.environ.get("BROWSER_TYPING_MAX_DURATION_MS", "600"))
+
+# Screenshot encoding configuration
+SCREENSHOT_FORMAT = os.environ.get("BROWSER_SCREENSHOT_FORMAT", "webp")
+SCREENSHOT_QUALITY = int(os.environ.get("BROWSER_SCREENSHOT_QUALITY", "80"))
+SCREENSHOT_ENCODER_THREADS = int(os.environ.get("BROWSER_SCREENSHOT_ENCODER_THREADS", "2"))
+
+# Consecutive frames whose downscaled grayscale thumbnails differ in at
+# most this fraction of pixels are stored once; a negative value disables
+# perceptual de-duplication (byte-identical frames are always shared)
+FRAME_DEDUP_THRESHOLD = float(os.environ.get("BROWSER_FRAME_DEDUP_THRESHOLD", "0.001"))
+FRAME_THUMBNAIL_SIZE = (160, 100)
+FRAME_PIXEL_TOLERANCE = 16
+
+# Element interaction steps (hover, click, typing) can be captured as just
+# the element's padded bounding box ("region") or as the tiles that changed
+# since the previous frame ("diff"), with coordinates for compositing;
+# every other step is a full frame. A diff covering more than
+# CAPTURE_DIFF_MAX_AREA of the frame is stored whole.
+CAPTURE_MODES = ("full", "region", "diff")
+CAPTURE_MODE = os.environ.get("BROWSER_CAPTURE_MODE", "full")
+CAPTURE_REGION_PADDING = int(os.environ.get("BROWSER_CAPTURE_REGION_PADDING", "32"))
+CAPTURE_TILE_SIZE = 64
+CAPTURE_DIFF_MAX_AREA = 0.5
+
+# Session recordings: one animated file per walk ("webp" or "apng") in
+# which each frame is shown for its real capture gap within these bounds
+RECORDING_FORMATS = ("webp", "apng")
+RECORDING_FORMAT = os.environ.get("BROWSER_RECORDING_FORMAT", "webp")
+RECORDING_QUALITY = int(os.environ.get("BROWSER_RECORDING_QUALITY", str(SCREENSHOT_QUALITY)))
+RECORDING_MIN_FRAME_MS = 500
+RECORDING_MAX_FRAME_MS = 3000
+
+# Asynchronous job configuration: visual and headless (extract, headless
+# plans) jobs run on separate workers sized to their pools, so extract
+# requests never queue behind visual walks
+JOB_WORKERS = int(os.environ.get("BROWSER_JOB_WORKERS", str(POOL_SIZE)))
+EXTRACT_JOB_WORKERS = int(os.environ.get(
+    "BROWSER_EXTRACT_JOB_WORKERS", str(EXTRACT_POOL_SIZE)
+))
+JOB_RETENTION_SECONDS = int(os.environ.get("BROWSER_JOB_RETENTION_SECONDS", "600"))
+
+# Admission control: once this many browse jobs are queued or running, new
+# requests get a 429 with Retry-After instead of waiting in line
+MAX_ACTIVE_JOBS = int(os.environ.get(
+    "BROWSER_MAX_ACTIVE_JOBS", str(POOL_SIZE + EXTRACT_POOL_SIZE + POOL_MAX_WAITERS)
+))
+# Synchronous /browse requests give up with a 504 after this many seconds
+BROWSE_REQUEST_TIMEOUT = float(os.environ.get("BROWSER_REQUEST_TIMEOUT", "120"))
+# Batch browsing: URLs per batch and the default deadline for the whole batch
+BATCH_MAX_URLS = int(os.environ.get("BROWSER_BATCH_MAX_URLS", "10"))
+BATCH_DEADLINE_SECONDS = float(os.environ.get("BROWSER_BATCH_DEADLINE_SECONDS", "90"))
+# Seconds running jobs get to finish after SIGTERM before they are cancelled
+DRAIN_TIMEOUT = float(os.environ.get("BROWSER_DRAIN_TIMEOUT", "60"))
+STREAM_HEARTBEAT_SECONDS = 5
+
+# Histogram buckets, in seconds, for the /metrics endpoint
+METRIC_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class BrowseError(Exception):
+    """Error raised while browsing, carrying the HTTP status to return.
+
+    ``retry_after`` is the number of seconds a client should wait before
+    retrying, sent as a Retry-After header.
+    """
+
+    def __init__(self, message, status_code=500, retry_after=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class BrowseCancelled(BrowseError):
+    """Raised inside a walk once its job has been cancelled"""
+
+    def __init__(self):
+        super().__init__("Browse job was cancelled", status_code=409)
+
+
+class PoolExhaustedError(BrowseError):
+    """Raised when no driver could be checked out of the pool in time"""
+
+    def __init__(self, message, status_code=503, retry_after=None):
+        super().__init__(message, status_code, retry_after)
+
+
+class OverloadedError(BrowseError):
+    """Raised when a request is refused because the service is at capacity"""
+
+    def __init__(self, message, retry_after, status_code=429):
+        super().__init__(message, status_code, retry_after)
+
+
+class Metrics:
+    """Thread-safe counters and histograms rendered in Prometheus text format"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+
+    def describe(self, name, kind, help_text):
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name, labels=None, amount=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, labels=None):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = {
+                    "buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0
+                }
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(
+            '{}="{}"'.format(
+                name,
+                str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            )
+            for name, value in pairs
+        ) + "}"
+
+    def render(self, gauges=()):
+        """Render every series plus ``gauges``, a list of
+        ``(name, kind, help, [(labels, value), ...])`` sampled by the caller"""
+        lines = []
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {
+                key: dict(series, buckets=list(series["buckets"]))
+                for key, series in self._histograms.items()
+            }
+
+        families = {}
+        for (name, labels), value in counters.items():
+            families.setdefault(name, []).append((labels, value))
+        for name, samples in sorted(families.items()):
+            kind, help_text = self._help.get(name, ("counter", name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{self._labels(labels)} {value}")
+
+        families = {}
+        for (name, labels), series in histograms.items():
+            families.setdefault(name, []).append((labels, series))
+        for name, samples in sorted(families.items()):
+            lines.append(f"# HELP {name} {self._help.get(name, ('', name))[1]}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, series in samples:
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    le = (("le", bound),)
+                    lines.append(f"{name}_bucket{self._labels(labels, le)} {count}")
+                inf = (("le", "+Inf"),)
+                lines.append(f"{name}_bucket{self._labels(labels, inf)} {series['count']}")
+                lines.append(f"{name}_sum{self._labels(labels)} {series['sum']:.6f}")
+                lines.append(f"{name}_count{self._labels(labels)} {series['count']}")
+
+        for name, kind, help_text, samples in gauges:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(
+                    f"{name}{self._labels(sorted(labels.items()))} {value}"
+                )
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics(METRIC_BUCKETS)
+metrics.describe(
+    "browser_phase_seconds", "histogram",
+    "Time spent in each phase of a browse (navigate, wait, scan, screenshot, encode, ...)"
+)
+metrics.describe(
+    "browser_pool_wait_seconds", "histogram",
+    "Time a request waited to check a driver out of a pool"
+)
+metrics.describe(
+    "browser_request_seconds", "histogram", "Total time of browse requests by mode"
+)
+metrics.describe(
+    "browser_requests_total", "counter", "Browse requests by mode and outcome"
+)
+
+
+class PhaseTimer:
+    """Accumulates the time one browse request spends in each phase"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds):
+        # Encoder threads report into the same timer as the request thread
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def summary(self):
+        with self._lock:
+            timings = {
+                f"{phase}_ms": round(seconds * 1000, 1)
+                for phase, seconds in self.phases.items()
+            }
+        timings["total_ms"] = round((time.monotonic() - self.started) * 1000, 1)
+        return timings
+
+
+# The PhaseTimer of the browse running on the current thread, if any
+request_context = threading.local()
+
+
+def current_timer():
+    return getattr(request_context, "timer", None)
+
+
+def record_phase(phase, seconds, timer=None):
+    """Add a phase duration to the metrics and to the request's timer"""
+    metrics.observe("browser_phase_seconds", seconds, {"phase": phase})
+    timer = timer if timer is not None else current_timer()
+    if timer is not None:
+        timer.add(phase, seconds)
+
+
+@contextmanager
+def timed(phase):
+    """Time a block as ``phase``; nested blocks of the same phase count once"""
+    active = request_context.__dict__.setdefault("active_phases", set())
+    if phase in active:
+        yield
+        return
+    active.add(phase)
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        active.discard(phase)
+        record_phase(phase, time.monotonic() - started)
+
+
+# Preferences applied to every profile unless it overrides them
+BASE_FIREFOX_PREFS = {
+    "toolkit.telemetry.enabled": False,
+    "toolkit.telemetry.unified": False,
+    "datareporting.healthreport.uploadEnabled": False,
+    "datareporting.policy.dataSubmissionEnabled": False,
+    "app.shield.optoutstudies.enabled": False,
+    "app.normandy.enabled": False,
+    "app.update.auto": False,
+    "browser.ping-centre.telemetry": False,
+    "browser.newtabpage.activity-stream.feeds.telemetry": False,
+    "extensions.pocket.enabled": False,
+    "network.prefetch-next": False,
+    "network.dns.disablePrefetch": True,
+    "network.predictor.enabled": False,
+    "network.http.speculative-parallel-limit": 0
+}
+
+# Blocked hosts are sent to a closed local port so they fail immediately
+BLOCKLIST_PAC = """function FindProxyForURL(url, host) {
+    var blocked = %s;
+    for (var i = 0; i < blocked.length; i++) {
+        if (host === blocked[i] || dnsDomainIs(host, "." + blocked[i])) {
+            return "PROXY 127.0.0.1:9";
+        }
+    }
+    return "DIRECT";
+}"""
+
+
+def profile_prefs(profile):
+    """Translate a driver profile into Firefox preferences"""
+    prefs = dict(BASE_FIREFOX_PREFS)
+    if profile.get("block_images"):
+        prefs["permissions.default.image"] = 2
+    if profile.get("block_media"):
+        prefs["media.autoplay.default"] = 5
+        prefs["media.mediasource.enabled"] = False
+        prefs["media.peerconnection.enabled"] = False
+    if profile.get("block_fonts"):
+        prefs["gfx.downloadable_fonts.enabled"] = False
+        prefs["browser.display.use_document_fonts"] = 0
+    if profile.get("block_trackers"):
+        prefs["privacy.trackingprotection.enabled"] = True
+        prefs["privacy.trackingprotection.socialtracking.enabled"] = True
+    if profile.get("cache_mb") is not None:
+        prefs["browser.cache.disk.capacity"] = int(profile["cache_mb"]) * 1024
+        prefs["browser.cache.memory.capacity"] = int(profile["cache_mb"]) * 1024
+    if profile.get("blocked_domains"):
+        pac = BLOCKLIST_PAC % json.dumps(list(profile["blocked_domains"]))
+        prefs["network.proxy.type"] = 2
+        prefs["network.proxy.autoconfig_url"] = (
+            "data:application/x-ns-proxy-autoconfig," + quote(pac)
+        )
+    prefs.update(profile.get("prefs", {}))
+    return prefs
+
 
 # Add a function to initialize the driver
-def initialize_driver():
-    global driver
+def initialize_driver(headless=False, profile=DEFAULT_PROFILE):
+    """Launch a new Firefox driver, returning None if it fails to start"""
     try:
         # Set up Firefox options - NOT headless for visual browsing
         firefox_options = Options()
-        # Not headless for visual browsing
+        if headless:
+            # Extract mode never shows up in the VNC session
+            firefox_options.add_argument("-headless")
         firefox_options.add_argument("--no-sandbox")
         firefox_options.add_argument("--disable-dev-shm-usage")
         firefox_options.add_argument("--width=1280")
         firefox_options.add_argument("--height=800")
+        # Chrome-context scripts clear every site's data between jobs
+        firefox_options.add_argument("-remote-allow-system-access")
+        for name, value in profile_prefs(DRIVER_PROFILES.get(profile, {})).items():
+            firefox_options.set_preference(name, value)
         
         # Use the DISPLAY environment variable set by supervisord
         # This ensures the browser is visible in the VNC session
-        print("Initializing Firefox driver with display:", os.environ.get('DISPLAY', ':1'))
+        if headless:
+            print(f"Initializing headless Firefox driver ({profile} profile)")
+        else:
+            print(f"Initializing Firefox driver ({profile} profile) with display:",
+                  os.environ.get('DISPLAY', ':1'))
         
         # Initialize the Firefox driver
-        driver = webdriver.Firefox(options=firefox_options)
+        with timed("driver_launch"):
+            driver = webdriver.Firefox(options=firefox_options)
         
         # Set window size
         driver.set_window_size(1280, 800)
         print("Firefox driver initialized successfully")
-        return True
+        return driver
     except Exception as e:
         print(f"Error initializing driver: {str(e)}")
-        return False
+        return None
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Simple health check endpoint"""
-    return jsonify({"status": "healthy"})
 
-@app.route('/browse', methods=['POST'])
-def browse_website():
-    """Browse a website with visual feedback"""
-    global driver
-    
-    data = request.json
-    url = data.get('url', 'https://www.example.com')
-    
+def quit_driver(driver):
+    """Quit a driver, ignoring errors from sessions that are already dead"""
+    try:
+        if driver:
+            driver.quit()
+    except Exception:
+        pass
+
+
+def quit_driver_later(driver):
+    """Quit a retired driver on a daemon thread.
+
+    A wedged geckodriver can block quit for a long time, so requests and
+    the watchdog hand the quit off instead of waiting for it.
+    """
+    threading.Thread(target=quit_driver, args=(driver,), daemon=True).start()
+
+
+def process_tree_rss(pid):
+    """Resident memory in bytes of a process and all of its descendants"""
+    children = {}
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+            # The command name may contain spaces, so split after it
+            ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry.name))
+
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            for line in Path(f"/proc/{current}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1]) * 1024
+                    break
+        except (OSError, ValueError):
+            pass
+        pending.extend(children.get(current, []))
+    return total
+
+
+def driver_rss(driver):
+    """Resident memory of the Firefox process tree behind a driver, or None"""
     try:
-        with driver_lock:
+        pid = driver.capabilities.get("moz:processID")
+    except Exception:
+        return None
+    if not pid:
+        return None
+    return process_tree_rss(int(pid))
+
+
+def driver_responsive(driver, timeout):
+    """Whether a driver answers a trivial script within ``timeout`` seconds"""
+    answered = threading.Event()
+
+    def ping():
+        try:
+            driver.execute_script("return 1")
+            answered.set()
+        except Exception:
+            pass
+
+    # A hung Firefox can block a command for minutes, so never ping inline
+    threading.Thread(target=ping, daemon=True).start()
+    return answered.wait(timeout)
+
+
+# Runs in Firefox's privileged chrome context and clears cookies and storage
+# of every site in the profile, including third-party ones; the HTTP cache
+# is kept. Calls back with the flags that failed to clear, 0 on success.
+CLEAR_SITE_DATA_JS = """
+var done = arguments[arguments.length - 1];
+var flags = 0;
+['CLEAR_COOKIES', 'CLEAR_DOM_STORAGES', 'CLEAR_DOM_QUOTA', 'CLEAR_AUTH_TOKENS',
+ 'CLEAR_AUTH_CACHE', 'CLEAR_STORAGE_ACCESS'].forEach(function(name) {
+    flags |= Ci.nsIClearDataService[name] || 0;
+});
+Services.clearData.deleteData(flags, function(failed) { done(failed); });
+"""
+
+
+def clear_site_data(driver):
+    """Delete cookies and storage of every origin the driver has visited"""
+    with driver.context(driver.CONTEXT_CHROME):
+        failed = driver.execute_async_script(CLEAR_SITE_DATA_JS)
+    if failed:
+        raise BrowseError(f"Clearing site data failed (flags {failed})")
+
+
+def reset_driver_state(driver):
+    """Bring a driver back to a blank single tab with no site data between jobs.
+
+    ``delete_all_cookies`` and ``localStorage.clear`` would only reach the
+    origin of the current page, so cookies and storage of every site are
+    cleared through the browser instead. If that fails the error reaches
+    the pool, which retires the driver rather than let state leak into the
+    next job.
+    """
+    handles = driver.window_handles
+    for handle in handles[1:]:
+        driver.switch_to.window(handle)
+        driver.close()
+    driver.switch_to.window(handles[0])
+    # Leave the page first so it cannot write anything back
+    driver.get("about:blank")
+    clear_site_data(driver)
+
+
+class PooledDriver:
+    """A Firefox driver owned by the pool together with its health state"""
+
+    def __init__(self, driver_id, driver, pool=None):
+        self.id = driver_id
+        self.driver = driver
+        self.pool = pool
+        self.healthy = True
+        self.created_at = time.time()
+        self.last_used = None
+        self.pages_served = 0
+        self.failures = 0
+        self.rss_bytes = None
+        self.retire_reason = None
+        # Set by session_state() to re-apply saved state to a replacement driver
+        self.restore_state = None
+
+    def mark_unhealthy(self, reason):
+        """Flag the driver so the pool replaces it on checkin"""
+        print(f"Marking driver {self.id} unhealthy: {reason}")
+        self.healthy = False
+        self.failures += 1
+
+    def recycle_reason(self):
+        """Why this driver should be retired instead of reused, if at all"""
+        if not self.healthy:
+            return "unhealthy"
+        if self.retire_reason:
+            return self.retire_reason
+        if self.pages_served >= MAX_PAGES_PER_DRIVER:
+            return f"served {self.pages_served} pages"
+        self.rss_bytes = driver_rss(self.driver)
+        if self.rss_bytes and self.rss_bytes > MAX_DRIVER_RSS_MB * 1024 * 1024:
+            return f"using {self.rss_bytes // (1024 * 1024)} MB"
+        return None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "healthy": self.healthy,
+            "age_seconds": round(time.time() - self.created_at, 1),
+            "pages_served": self.pages_served,
+            "failures": self.failures,
+            "rss_bytes": self.rss_bytes
+        }
+
+
+class DriverPool:
+    """Fixed-size pool of Firefox drivers with a bounded wait queue.
+
+    Drivers are launched lazily up to ``size``. Callers that find every
+    driver busy wait for a checkin, but at most ``max_waiters`` callers may
+    queue at once and each waits no longer than ``checkout_timeout``.
+
+    Drivers are kept alive between jobs and reset on checkin. A driver is
+    only recycled after ``MAX_PAGES_PER_DRIVER`` pages or once its process
+    tree grows past ``MAX_DRIVER_RSS_MB``. ``standby`` extra drivers are
+    launched in the background so a retired driver is replaced without a
+    cold start on the request path; without one, the freed slot is
+    refilled in the background. ``check`` is called by the watchdog to
+    retire idle drivers that stopped responding or grew too large.
+    """
+
+    def __init__(self, name, size, max_waiters, checkout_timeout, standby=0,
+                 headless=False, profile=DEFAULT_PROFILE):
+        self.name = name
+        self.headless = headless
+        self.profile = profile
+        self.size = max(1, size)
+        self.max_waiters = max_waiters
+        self.checkout_timeout = checkout_timeout
+        self.standby = max(0, standby)
+        self._condition = threading.Condition()
+        self._idle = []
+        self._busy = {}
+        self._standby = []
+        self._launching = 0
+        self._standby_launching = 0
+        self._checking = 0
+        self._waiters = 0
+        self._next_id = 1
+        self._closed = False
+        self.recycled = 0
+        self.watchdog_retired = 0
+
+    def _total(self):
+        return len(self._idle) + len(self._busy) + self._launching + self._checking
+
+    def _wrap(self, driver):
+        """Give a freshly launched driver a pool id; caller holds the lock"""
+        pooled = PooledDriver(self._next_id, driver, self)
+        self._next_id += 1
+        return pooled
+
+    def _launch(self):
+        """Start a new driver for a slot reserved by the caller"""
+        with self._condition:
+            if self._standby:
+                pooled = self._standby.pop()
+                self._launching -= 1
+                self._busy[pooled.id] = pooled
+                self._schedule_standby()
+                return pooled
+
+        driver = initialize_driver(self.headless, self.profile)
+        with self._condition:
+            self._launching -= 1
             if driver is None:
-                success = initialize_driver()
-                if not success:
-                    return jsonify({
-                        "error": "Failed to initialize WebDriver",
-                        "url": url
-                    }), 500
-            
-            # Create directory for screenshots
-            timestamp = int(time.time())
-            visual_dir = SCREENSHOTS_DIR / f"visual_{timestamp}"
-            visual_dir.mkdir(exist_ok=True)
-            
+                self._condition.notify()
+                return None
+            pooled = self._wrap(driver)
+            self._busy[pooled.id] = pooled
+            return pooled
+
+    def _schedule_standby(self):
+        """Top up the standby drivers in the background; caller holds the lock"""
+        missing = self.standby - len(self._standby) - self._standby_launching
+        for _ in range(max(0, missing)):
+            self._standby_launching += 1
+            threading.Thread(target=self._launch_standby, daemon=True).start()
+
+    def _launch_standby(self):
+        driver = initialize_driver(self.headless, self.profile)
+        with self._condition:
+            self._standby_launching -= 1
+            if driver is None:
+                return
+            if self._closed:
+                closed = True
+            else:
+                closed = False
+                self._standby.append(self._wrap(driver))
+                self._condition.notify()
+        if closed:
+            quit_driver(driver)
+
+    def _launch_idle(self):
+        """Launch a driver straight into the idle list for a reserved slot"""
+        driver = initialize_driver(self.headless, self.profile)
+        with self._condition:
+            self._launching -= 1
+            if driver is not None and not self._closed:
+                self._idle.append(self._wrap(driver))
+                driver = None
+            self._condition.notify()
+        if driver is not None:
+            quit_driver(driver)
+
+    def _refill(self):
+        """Fill a retired driver's slot with a standby driver or a background
+        launch, so no request waits on a cold start; caller holds the lock"""
+        if self._closed:
+            return
+        if self._standby:
+            self._idle.append(self._standby.pop())
+            self._schedule_standby()
+        elif self._total() < self.size:
+            self._launching += 1
+            threading.Thread(target=self._launch_idle, daemon=True).start()
+
+    def start(self):
+        """Pre-launch the standby drivers so the first request starts warm"""
+        with self._condition:
+            self._schedule_standby()
+
+    def acquire(self, timeout=None):
+        """Check out a healthy driver, launching one if a slot is free"""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        with self._condition:
+            if (not self._idle and self._total() >= self.size and
+                    self._waiters >= self.max_waiters):
+                raise PoolExhaustedError(
+                    "Browser pool is saturated, too many requests waiting",
+                    status_code=429,
+                    retry_after=max(1, int(self.checkout_timeout))
+                )
+            self._waiters += 1
+            try:
+                while True:
+                    if self._idle:
+                        pooled = self._idle.pop()
+                        self._busy[pooled.id] = pooled
+                        self._record_wait(started)
+                        return pooled
+                    if self._total() < self.size:
+                        self._launching += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolExhaustedError(
+                            f"Timed out after {timeout}s waiting for a browser"
+                        )
+                    self._condition.wait(remaining)
+            finally:
+                self._waiters -= 1
+
+        pooled = self._launch()
+        if pooled is None:
+            raise BrowseError("Failed to initialize WebDriver")
+        self._record_wait(started)
+        return pooled
+
+    def _record_wait(self, started):
+        waited = time.monotonic() - started
+        metrics.observe("browser_pool_wait_seconds", waited, {"pool": self.name})
+        record_phase("pool_wait", waited)
+
+    def release(self, pooled):
+        """Reset a driver and return it to the pool, or retire it"""
+        pooled.last_used = time.time()
+        reason = pooled.recycle_reason()
+        if reason is None:
             try:
-                # Navigate to URL
-                driver.get(url)
-                time.sleep(2)
+                reset_driver_state(pooled.driver)
             except Exception as e:
-                # If navigation fails, try to reinitialize the driver
-                print(f"Navigation failed: {str(e)}, reinitializing driver")
-                try:
-                    if driver:
-                        driver.quit()
-                except:
-                    pass
-                
-                driver = None
-                success = initialize_driver()
-                if not success:
-                    return jsonify({
-                        "error": "Failed to reinitialize WebDriver after navigation error",
-                        "url": url
-                    }), 500
-                
-                # Try navigation again
-                driver.get(url)
-                time.sleep(2)
-            
-            # Inject cursor visualization
-            cursor_js = """
-            var cursor = document.createElement('div');
-            cursor.id = 'selenium-mouse-cursor';
-            cursor.style.position = 'absolute';
-            cursor.style.width = '20px';
-            cursor.style.height = '20px';
-            cursor.style.borderRadius = '10px';
-            cursor.style.backgroundColor = 'rgba(255, 0, 0, 0.5)';
-            cursor.style.zIndex = '9999';
-            cursor.style.pointerEvents = 'none';
-            document.body.appendChild(cursor);
-            
-            window.addEventListener('mousemove', function(e) {
-                cursor.style.left = e.clientX + 'px';
-                cursor.style.top = e.clientY + 'px';
-            });
-            """
-            driver.execute_script(cursor_js)
-            
-            # Take initial screenshot
-            initial_screenshot_path = visual_dir / f"step_0_{timestamp}.png"
-            driver.save_screenshot(str(initial_screenshot_path))
-            
-            # Create action chain for mouse movements
-            actions = ActionChains(driver)
-            
-            # Lists to store visual feedback data
-            screenshots = [str(initial_screenshot_path)]
-            descriptions = [f"Initial page load of {url}"]
-            cursor_positions = [None]  # No cursor for initial view
-            interactions = ["page_load"]
-            
-            # Find interactive elements
-            interactive_elements = []
+                reason = f"reset failed: {str(e)}"
+
+        if reason is not None:
+            print(f"Recycling driver {pooled.id}: {reason}")
+            quit_driver_later(pooled.driver)
+            with self._condition:
+                self._busy.pop(pooled.id, None)
+                self.recycled += 1
+                self._refill()
+                self._condition.notify()
+            return
+
+        with self._condition:
+            self._busy.pop(pooled.id, None)
+            if self._closed:
+                closed = True
+            else:
+                closed = False
+                self._idle.append(pooled)
+                self._condition.notify()
+        if closed:
+            quit_driver(pooled.driver)
+
+    def replace(self, pooled):
+        """Swap a broken checked-out driver for a warm one.
+
+        A standby driver is used first, then an idle one whose slot is
+        refilled in the background. Only when every driver is busy and no
+        standby is ready does the caller wait for a fresh launch. The broken
+        driver is quit in the background.
+        """
+        quit_driver_later(pooled.driver)
+        with self._condition:
+            spare = None
+            if self._standby:
+                spare = self._standby.pop()
+                self._schedule_standby()
+            elif self._idle:
+                spare = self._idle.pop()
+                self._launching += 1
+                threading.Thread(target=self._launch_idle, daemon=True).start()
+        driver = spare.driver if spare else initialize_driver(self.headless, self.profile)
+        if driver is None:
+            pooled.mark_unhealthy("replacement driver failed to start")
+            raise BrowseError("Failed to reinitialize WebDriver")
+        with self._condition:
+            self.recycled += 1
+        pooled.driver = driver
+        pooled.healthy = True
+        pooled.created_at = time.time()
+        pooled.pages_served = 0
+        pooled.rss_bytes = None
+        pooled.retire_reason = None
+        return pooled
+
+    def check(self, ping_timeout=WATCHDOG_PING_TIMEOUT):
+        """Ping idle drivers and sample memory, retiring any past a threshold.
+
+        Idle drivers are taken out of the pool one at a time while they are
+        checked. Busy drivers over the memory limit are flagged and retired
+        when they are checked back in. Retired drivers are quit in the
+        background and their slot refilled straight away.
+        """
+        with self._condition:
+            if self._closed:
+                return
+            idle = list(self._idle)
+            busy = list(self._busy.values())
+
+        for pooled in busy:
+            pooled.rss_bytes = driver_rss(pooled.driver)
+            if pooled.rss_bytes and pooled.rss_bytes > MAX_DRIVER_RSS_MB * 1024 * 1024:
+                pooled.retire_reason = f"using {pooled.rss_bytes // (1024 * 1024)} MB"
+
+        for pooled in idle:
+            with self._condition:
+                if pooled not in self._idle:
+                    continue
+                self._idle.remove(pooled)
+                self._checking += 1
+            reason = pooled.recycle_reason()
+            if reason is None and not driver_responsive(pooled.driver, ping_timeout):
+                reason = f"no response within {ping_timeout}s"
+            with self._condition:
+                self._checking -= 1
+                if reason is None and not self._closed:
+                    self._idle.append(pooled)
+                    self._condition.notify()
+                    continue
+            if reason is not None:
+                print(f"Watchdog retiring driver {pooled.id} in {self.name} pool: {reason}")
+            quit_driver_later(pooled.driver)
+            with self._condition:
+                if reason is not None:
+                    self.recycled += 1
+                    self.watchdog_retired += 1
+                self._refill()
+                self._condition.notify()
+
+        with self._condition:
+            # Standby launches that failed earlier are retried here
+            if not self._closed:
+                self._schedule_standby()
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        """Context manager that checks a driver out and always checks it in"""
+        pooled = self.acquire(timeout)
+        try:
+            yield pooled
+        finally:
+            self.release(pooled)
+
+    def stats(self):
+        with self._condition:
+            drivers = list(self._idle) + list(self._busy.values())
+            return {
+                "name": self.name,
+                "headless": self.headless,
+                "profile": self.profile,
+                "size": self.size,
+                "idle": len(self._idle),
+                "busy": len(self._busy),
+                "launching": self._launching,
+                "checking": self._checking,
+                "standby": len(self._standby),
+                "waiting": self._waiters,
+                "max_waiters": self.max_waiters,
+                "recycled": self.recycled,
+                "watchdog_retired": self.watchdog_retired,
+                "drivers": [pooled.to_dict() for pooled in drivers]
+            }
+
+    def shutdown(self):
+        """Quit idle and standby drivers; busy drivers are quit on checkin"""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            standby, self._standby = self._standby, []
+        for pooled in idle + standby:
+            quit_driver(pooled.driver)
+
+
+driver_pool = DriverPool(
+    "visual", POOL_SIZE, POOL_MAX_WAITERS, POOL_CHECKOUT_TIMEOUT,
+    standby=STANDBY_DRIVERS
+)
+
+# Headless drivers for extract mode, kept apart from the visible display
+extract_pool = DriverPool(
+    "extract", EXTRACT_POOL_SIZE, POOL_MAX_WAITERS, POOL_CHECKOUT_TIMEOUT,
+    standby=EXTRACT_STANDBY_DRIVERS, headless=True, profile=EXTRACT_PROFILE
+)
+
+# Pools for profiles other than the two defaults, created on first use
+profile_pools = {}
+profile_pools_lock = threading.Lock()
+
+
+def get_pool(headless=False, profile=None):
+    """Return the pool serving a profile, creating a small one if needed"""
+    base = extract_pool if headless else driver_pool
+    if profile is None or profile == base.profile:
+        return base
+    if profile not in DRIVER_PROFILES:
+        raise BrowseError(
+            f"Unknown profile: {profile}; expected one of "
+            f"{', '.join(sorted(DRIVER_PROFILES))}",
+            status_code=400
+        )
+    with profile_pools_lock:
+        pool = profile_pools.get((headless, profile))
+        if pool is None:
+            pool = DriverPool(
+                f"{base.name}-{profile}", PROFILE_POOL_SIZE, POOL_MAX_WAITERS,
+                POOL_CHECKOUT_TIMEOUT, headless=headless, profile=profile
+            )
+            profile_pools[(headless, profile)] = pool
+        return pool
+
+
+def all_pools():
+    """Every driver pool, including profile pools created so far"""
+    return [driver_pool, extract_pool] + list(profile_pools.values())
+
+
+class DriverWatchdog:
+    """Background supervisor that runs ``DriverPool.check`` on every pool.
+
+    Crashed or hung drivers are found while idle, instead of by the next
+    request that navigates with them, and oversized ones are retired
+    before they slow the machine down.
+    """
+
+    def __init__(self, interval, ping_timeout):
+        self.interval = interval
+        self.ping_timeout = ping_timeout
+        self._thread = None
+        self._stop = threading.Event()
+        self.last_run = None
+        self.runs = 0
+
+    def run_once(self):
+        for pool in all_pools():
+            pool.check(self.ping_timeout)
+        self.last_run = time.time()
+        self.runs += 1
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
             try:
-                # First 5 links that are visible
-                links = driver.find_elements(By.TAG_NAME, "a")
-                visible_links = [
-                    link for link in links[:20]
-                    if link.is_displayed()
-                ]
-                interactive_elements.extend(visible_links[:5])
-                
-                # First 3 buttons that are visible
-                buttons = driver.find_elements(By.TAG_NAME, "button")
-                visible_buttons = [
-                    button for button in buttons[:10]
-                    if button.is_displayed()
-                ]
-                interactive_elements.extend(visible_buttons[:3])
-                
-                # First 3 inputs that are visible
-                inputs = driver.find_elements(By.TAG_NAME, "input")
-                visible_inputs = [
-                    input_elem for input_elem in inputs[:10]
-                    if input_elem.is_displayed()
-                ]
-                interactive_elements.extend(visible_inputs[:3])
+                self.run_once()
             except Exception as e:
-                print(f"Error finding elements: {e}")
-            
-            # Limit to 8 elements total
-            interactive_elements = interactive_elements[:8]
-            
-            # First, do a general page scroll
-            for scroll_step in range(3):
-                # Scroll down smoothly
-                driver.execute_script(
-                    f"""window.scrollTo({{
-                        top: {(scroll_step + 1) * 300},
-                        behavior: 'smooth'
-                    }});"""
-                )
-                time.sleep(1)
-                
-                # Take screenshot after scrolling
-                scroll_path = visual_dir / f"scroll_{scroll_step+1}_{timestamp}.png"
-                driver.save_screenshot(str(scroll_path))
-                screenshots.append(str(scroll_path))
-                descriptions.append(
-                    f"Scrolling down to explore content (step {scroll_step+1})"
-                )
-                cursor_positions.append({
-                    "x": 640,
-                    "y": 300 + (scroll_step * 100)
-                })
-                interactions.append("scroll")
-            
-            # Scroll back to top
-            driver.execute_script("window.scrollTo({top: 0, behavior: 'smooth'});")
-            time.sleep(1)
-            
-            # Interact with elements
-            for i, element in enumerate(interactive_elements):
-                try:
-                    # Check if element is still visible
-                    if not element.is_displayed():
-                        continue
-                    
-                    # Scroll element into view
-                    driver.execute_script(
-                        """arguments[0].scrollIntoView({
-                            behavior: 'smooth',
-                            block: 'center'
-                        });""",
-                        element
-                    )
-                    time.sleep(1)
-                    
-                    # Take screenshot after scrolling
-                    scroll_path = visual_dir / f"step_{i+1}_scroll_{timestamp}.png"
-                    driver.save_screenshot(str(scroll_path))
-                    screenshots.append(str(scroll_path))
-                    
-                    # Get element description
-                    tag_name = element.tag_name
-                    element_text = element.text[:30] if element.text else ""
-                    element_type = element.get_attribute("type") or ""
-                    
-                    if tag_name == "a":
-                        descriptions.append(f"Scrolled to link: {element_text}")
-                    elif tag_name == "button":
-                        descriptions.append(f"Scrolled to button: {element_text}")
-                    elif tag_name == "input":
-                        descriptions.append(f"Scrolled to input field of type: {element_type}")
-                    else:
-                        descriptions.append(f"Scrolled to {tag_name} element")
-                    
-                    interactions.append("scroll_to_element")
-                    
-                    # Get element position for cursor tracking
-                    rect = driver.execute_script("""
-                        var rect = arguments[0].getBoundingClientRect();
-                        return {
-                            x: rect.left + rect.width / 2,
-                            y: rect.top + rect.height / 2,
-                            width: rect.width,
-                            height: rect.height
-                        };
-                    """, element)
-                    
-                    cursor_x = rect['x']
-                    cursor_y = rect['y']
-                    
-                    # Add cursor position
-                    cursor_positions.append({
-                        "x": cursor_x,
-                        "y": cursor_y
-                    })
-                    
-                    # Move cursor to element
-                    actions.move_to_element(element).perform()
-                    time.sleep(0.5)
-                    
-                    # Take screenshot with cursor hovering
-                    hover_path = visual_dir / f"step_{i+1}_hover_{timestamp}.png"
-                    driver.save_screenshot(str(hover_path))
-                    screenshots.append(str(hover_path))
-                    
-                    if tag_name == "a":
-                        descriptions.append(f"Hovering over link: {element_text}")
-                        interactions.append("hover_link")
-                    elif tag_name == "button":
-                        descriptions.append(f"Hovering over button: {element_text}")
-                        interactions.append("hover_button")
-                    elif tag_name == "input":
-                        descriptions.append(f"Hovering over input field of type: {element_type}")
-                        interactions.append("hover_input")
-                    else:
-                        descriptions.append(f"Hovering over {tag_name} element")
-                        interactions.append("hover_element")
-                    
-                    # Add cursor position
-                    cursor_positions.append({
-                        "x": cursor_x,
-                        "y": cursor_y
-                    })
-                    
-                    # For input elements, simulate typing
-                    if (tag_name == "input" and
-                            element.is_displayed() and
-                            element.is_enabled()):
-                        element_type = element.get_attribute("type") or ""
-                        if element_type in ["text", "search", "email", "password"]:
-                            try:
-                                # Click on the input field
-                                actions.click().perform()
-                                time.sleep(0.3)
-                                
-                                # Take screenshot after clicking
-                                click_path = visual_dir / f"step_{i+1}_click_{timestamp}.png"
-                                driver.save_screenshot(str(click_path))
-                                
-                                # Add to visual feedback data
-                                screenshots.append(str(click_path))
-                                descriptions.append(f"Clicked on {element_type} field")
-                                cursor_positions.append({"x": cursor_x, "y": cursor_y})
-                                interactions.append("click_input")
-                                
-                                # Clear the field
-                                element.clear()
-                                time.sleep(0.3)
-                                
-                                # Determine what text to type
-                                sample_text = "Sample text for demonstration"
-                                if "search" in element_type.lower() or (element.get_attribute("name") and "search" in element.get_attribute("name").lower()):
-                                    sample_text = "search query example"
-                                elif "email" in element_type.lower():
-                                    sample_text = "example@email.com"
-                                elif "password" in element_type.lower():
-                                    sample_text = "••••••••"
-                                
-                                # Type sample text character by character
-                                for char in sample_text:
-                                    element.send_keys(char)
-                                    time.sleep(0.1)
-                                
-                                # Take screenshot after typing
-                                typing_path = visual_dir / f"step_{i+1}_typing_{timestamp}.png"
-                                driver.save_screenshot(str(typing_path))
-                                screenshots.append(str(typing_path))
-                                descriptions.append(f"Typing in {element_type}: '{sample_text}'")
-                                interactions.append("typing")
-                                cursor_positions.append({"x": cursor_x, "y": cursor_y})
-                            except Exception as e:
-                                print(f"Error typing in element {i}: {e}")
-                    
-                    # For links and buttons, simulate clicking on the last one
-                    elif tag_name in ["a", "button"] and i == len(interactive_elements) - 1:
-                        try:
-                            # Take screenshot before clicking
-                            pre_click_path = visual_dir / f"step_{i+1}_pre_click_{timestamp}.png"
-                            driver.save_screenshot(str(pre_click_path))
-                            screenshots.append(str(pre_click_path))
-                            descriptions.append(f"About to click {tag_name}: {element_text}")
-                            cursor_positions.append({"x": cursor_x, "y": cursor_y})
-                            interactions.append("pre_click")
-                            
-                            # Click the element
-                            actions.click().perform()
-                            time.sleep(2)
-                            
-                            # Take screenshot after clicking
-                            post_click_path = visual_dir / f"step_{i+1}_post_click_{timestamp}.png"
-                            driver.save_screenshot(str(post_click_path))
-                            screenshots.append(str(post_click_path))
-                            descriptions.append(f"After clicking {tag_name}: {element_text}")
-                            cursor_positions.append(None)
-                            interactions.append("post_click")
-                        except Exception as e:
-                            print(f"Error clicking element {i}: {e}")
-                except Exception as e:
-                    print(f"Error interacting with element {i}: {e}")
-            
-            # Take final screenshot
-            final_screenshot_path = visual_dir / f"step_final_{timestamp}.png"
-            driver.save_screenshot(str(final_screenshot_path))
-            screenshots.append(str(final_screenshot_path))
-            descriptions.append("Final view of the page")
-            cursor_positions.append(None)
-            interactions.append("final_view")
-            
-            # Get page title and content
-            title = driver.title
-            body_text = driver.find_element(By.TAG_NAME, "body").text
-            
-            # Limit text content
-            if len(body_text) > 5000:
-                body_text = body_text[:5000] + "... [content truncated]"
-            
-            # Close the browser
-            driver.quit()
-            
-            # Create relative paths for frontend
-            relative_screenshots = [
-                str(Path(s).relative_to(DATA_DIR)) for s in screenshots
-            ]
-            
-            # Prepare result
-            result_data = {
-                "title": title,
-                "url": url,
-                "screenshots": relative_screenshots,
-                "descriptions": descriptions,
-                "cursor_positions": cursor_positions,
-                "interactions": interactions,
-                "content_preview": (
-                    body_text[:500] + "..." if len(body_text) > 500 else body_text
-                ),
-                "timestamp": timestamp
+                print(f"Error checking browser drivers: {e}")
+
+    def start(self):
+        """Check the pools in a background thread"""
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            "interval_seconds": self.interval,
+            "ping_timeout_seconds": self.ping_timeout,
+            "runs": self.runs,
+            "last_run": self.last_run,
+            "retired": sum(pool.watchdog_retired for pool in all_pools())
+        }
+
+
+driver_watchdog = DriverWatchdog(WATCHDOG_INTERVAL_SECONDS, WATCHDOG_PING_TIMEOUT)
+
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """Simple health check endpoint"""
+    return jsonify({
+        "status": "healthy",
+        "pool": driver_pool.stats(),
+        "extract_pool": extract_pool.stats(),
+        "profile_pools": [pool.stats() for pool in list(profile_pools.values())],
+        "watchdog": driver_watchdog.stats(),
+        "cache": result_cache.stats(),
+        "retention": retention_manager.stats(),
+        "jobs": job_manager.stats(),
+        "admission": job_manager.admission(),
+        "session_state": {
+            "restored": session_states.restored,
+            "saved": session_states.saved
+        }
+    })
+
+
+def pool_gauges():
+    """Sample pool, cache and job state as gauges for /metrics"""
+    pools = [pool.stats() for pool in all_pools()]
+    cache = result_cache.stats()
+    lookups = cache["hits"] + cache["misses"]
+    admission = job_manager.admission()
+    return [
+        ("browser_pool_size", "gauge", "Maximum drivers in each pool",
+         [({"pool": p["name"]}, p["size"]) for p in pools]),
+        ("browser_pool_drivers", "gauge", "Drivers in each pool by state",
+         [({"pool": p["name"], "state": state}, p[state])
+          for p in pools for state in ("idle", "busy", "launching", "standby")]),
+        ("browser_pool_occupancy", "gauge", "Fraction of each pool's drivers checked out",
+         [({"pool": p["name"]}, round(p["busy"] / p["size"], 3)) for p in pools]),
+        ("browser_pool_waiting", "gauge", "Requests waiting for a driver",
+         [({"pool": p["name"]}, p["waiting"]) for p in pools]),
+        ("browser_driver_restarts_total", "counter",
+         "Drivers recycled or replaced after a failure",
+         [({"pool": p["name"]}, p["recycled"]) for p in pools]),
+        ("browser_watchdog_retired_total", "counter",
+         "Drivers retired by the watchdog as unresponsive or oversized",
+         [({"pool": p["name"]}, p["watchdog_retired"]) for p in pools]),
+        ("browser_cache_hits_total", "counter", "Result cache hits",
+         [({}, cache["hits"])]),
+        ("browser_cache_misses_total", "counter", "Result cache misses",
+         [({}, cache["misses"])]),
+        ("browser_cache_hit_ratio", "gauge", "Result cache hits per lookup",
+         [({}, round(cache["hits"] / lookups, 3) if lookups else 0)]),
+        ("browser_active_jobs", "gauge", "Browse jobs queued or running",
+         [({}, admission["active"])]),
+        ("browser_rejected_total", "counter",
+         "Browse requests refused by admission control",
+         [({}, admission["rejected"])]),
+        ("browser_jobs", "gauge", "Retained browse jobs by status",
+         [({"status": status}, count)
+          for status, count in sorted(job_manager.stats().items())])
+    ]
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Phase timings, pool occupancy and cache counters in Prometheus format"""
+    return Response(
+        metrics.render(pool_gauges()),
+        mimetype="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+def wait_until(driver, condition, timeout):
+    """Poll a condition with WebDriverWait, returning False on timeout"""
+    with timed("wait"):
+        try:
+            WebDriverWait(
+                driver, timeout, poll_frequency=READY_POLL_INTERVAL
+            ).until(condition)
+            return True
+        except TimeoutException:
+            return False
+
+
+def wait_for_document_ready(driver, timeout=PAGE_READY_TIMEOUT):
+    """Wait until the document has finished parsing and loading"""
+    return wait_until(
+        driver,
+        lambda d: d.execute_script("return document.readyState") == "complete",
+        timeout
+    )
+
+
+# Installed on the page by the first idle check and kept on window until the
+# next navigation. Fetch and XHR calls are counted while in flight, and a
+# PerformanceObserver records when any resource finishes, so neither an
+# unfinished request nor a full resource timing buffer reads as idle.
+# Other requests (images, scripts, CSS) are only seen once they finish, and
+# requests already running before the first check are not counted.
+NETWORK_IDLE_JS = """
+var idle = window.__networkIdle;
+if (!idle) {
+    idle = window.__networkIdle = {inflight: 0, last: 0};
+    var touch = function(end) {
+        idle.last = Math.max(idle.last, end === undefined ? performance.now() : end);
+    };
+    var start = function() { idle.inflight++; touch(); };
+    var finish = function() { idle.inflight = Math.max(0, idle.inflight - 1); touch(); };
+    var nav = performance.getEntriesByType('navigation')[0];
+    if (nav) {
+        touch(nav.loadEventEnd);
+    }
+    performance.getEntriesByType('resource').forEach(function(entry) {
+        touch(entry.responseEnd);
+    });
+    performance.setResourceTimingBufferSize(1000);
+    performance.addEventListener('resourcetimingbufferfull', function() {
+        performance.clearResourceTimings();
+    });
+    if (window.PerformanceObserver) {
+        try {
+            new PerformanceObserver(function(list) {
+                list.getEntries().forEach(function(entry) { touch(entry.responseEnd); });
+            }).observe({type: 'resource'});
+        } catch (e) {}
+    }
+    if (window.fetch) {
+        var fetch = window.fetch;
+        window.fetch = function() {
+            start();
+            try {
+                return fetch.apply(this, arguments).then(
+                    function(response) { finish(); return response; },
+                    function(error) { finish(); throw error; }
+                );
+            } catch (e) {
+                finish();
+                throw e;
             }
-            
-            return jsonify(result_data)
-    
+        };
+    }
+    var send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function() {
+        start();
+        this.addEventListener('loadend', finish);
+        try {
+            return send.apply(this, arguments);
+        } catch (e) {
+            finish();
+            throw e;
+        }
+    };
+}
+return idle.inflight === 0 && performance.now() - idle.last >= arguments[0];
+"""
+
+
+def wait_for_network_idle(driver, timeout=PAGE_READY_TIMEOUT, idle_ms=NETWORK_IDLE_MS):
+    """Wait until no fetch/XHR is in flight and nothing has finished for ``idle_ms``"""
+    return wait_until(
+        driver,
+        lambda d: d.execute_script(NETWORK_IDLE_JS, idle_ms),
+        timeout
+    )
+
+
+def wait_for_scroll_end(driver, timeout=SETTLE_TIMEOUT):
+    """Wait until smooth scrolling has stopped moving the viewport"""
+    last = {"position": None}
+
+    def scroll_stopped(d):
+        position = d.execute_script("return [window.scrollX, window.scrollY];")
+        stopped = position == last["position"]
+        last["position"] = position
+        return stopped
+
+    return wait_until(driver, scroll_stopped, timeout)
+
+
+ANIMATION_FRAMES_JS = """
+var done = arguments[arguments.length - 1];
+var remaining = arguments[0];
+var fallback = setTimeout(function() { done(false); }, arguments[1]);
+function tick() {
+    if (--remaining <= 0) {
+        clearTimeout(fallback);
+        done(true);
+    } else {
+        requestAnimationFrame(tick);
+    }
+}
+requestAnimationFrame(tick);
+"""
+
+
+def wait_for_animation_frames(driver, frames=2, timeout=SETTLE_TIMEOUT):
+    """Wait for the browser to paint ``frames`` animation frames"""
+    with timed("wait"):
+        try:
+            return bool(driver.execute_async_script(
+                ANIMATION_FRAMES_JS, frames, int(timeout * 1000)
+            ))
+        except Exception:
+            return False
+
+
+def wait_for_page_ready(driver, timeout=PAGE_READY_TIMEOUT):
+    """Wait for document load and network idle within one deadline"""
+    deadline = time.monotonic() + timeout
+    wait_for_document_ready(driver, timeout)
+    wait_for_network_idle(driver, max(0.0, deadline - time.monotonic()))
+
+
+def wait_for_settle(driver, timeout=SETTLE_TIMEOUT):
+    """Wait for scrolling to end and the next frames to be painted"""
+    deadline = time.monotonic() + timeout
+    wait_for_scroll_end(driver, timeout)
+    wait_for_animation_frames(
+        driver, timeout=max(0.1, deadline - time.monotonic())
+    )
+
+
+ELEMENT_SCAN_JS = """
+var groups = arguments[0];
+var textLength = arguments[1];
+function isVisible(el) {
+    var rect = el.getBoundingClientRect();
+    if (rect.width <= 0 || rect.height <= 0) {
+        return false;
+    }
+    var style = window.getComputedStyle(el);
+    return style.visibility !== 'hidden' && style.display !== 'none' &&
+        parseFloat(style.opacity) > 0;
+}
+var results = [];
+groups.forEach(function(group) {
+    var nodes = document.querySelectorAll(group.selector);
+    var taken = 0;
+    for (var i = 0; i < nodes.length && i < group.scan && taken < group.take; i++) {
+        var el = nodes[i];
+        if (!isVisible(el)) {
+            continue;
+        }
+        var rect = el.getBoundingClientRect();
+        results.push({
+            element: el,
+            tag: el.tagName.toLowerCase(),
+            text: (el.innerText || '').trim().slice(0, textLength),
+            type: (el.type !== undefined ? el.type : el.getAttribute('type')) || '',
+            name: el.getAttribute('name') || '',
+            rect: {
+                x: rect.left + rect.width / 2,
+                y: rect.top + rect.height / 2,
+                width: rect.width,
+                height: rect.height
+            }
+        });
+        taken++;
+    }
+});
+return results;
+"""
+
+SCAN_SCRIPT_PATH = os.environ.get("BROWSER_SCAN_SCRIPT")
+if SCAN_SCRIPT_PATH:
+    ELEMENT_SCAN_JS = Path(SCAN_SCRIPT_PATH).read_text()
+
+# Scrolls an element into view if it is still visible, in one round trip
+SCROLL_TO_ELEMENT_JS = """
+var el = arguments[0];
+var rect = el.getBoundingClientRect();
+var style = window.getComputedStyle(el);
+if (rect.width <= 0 || rect.height <= 0 || style.visibility === 'hidden' ||
+        style.display === 'none') {
+    return false;
+}
+el.scrollIntoView({behavior: 'smooth', block: 'center'});
+return true;
+"""
+
+# Current viewport position and state of an element after scrolling
+ELEMENT_STATE_JS = """
+var el = arguments[0];
+var rect = el.getBoundingClientRect();
+return {
+    x: rect.left + rect.width / 2,
+    y: rect.top + rect.height / 2,
+    width: rect.width,
+    height: rect.height,
+    visible: rect.width > 0 && rect.height > 0,
+    enabled: !el.disabled
+};
+"""
+
+# WebDriver can only screenshot an element's own box, so the padded area
+# around an element is captured through a transparent fixed overlay
+CAPTURE_REGION_JS = """
+var rect = arguments[0].getBoundingClientRect(), pad = arguments[1];
+var left = Math.max(0, Math.floor(rect.left - pad));
+var top = Math.max(0, Math.floor(rect.top - pad));
+var right = Math.min(window.innerWidth, Math.ceil(rect.right + pad));
+var bottom = Math.min(window.innerHeight, Math.ceil(rect.bottom + pad));
+if (right - left < 1 || bottom - top < 1) {
+    return null;
+}
+var box = document.createElement('div');
+box.id = '__capture_region';
+box.style.cssText = 'position:fixed;margin:0;border:0;padding:0;' +
+    'pointer-events:none;background:transparent;left:' + left + 'px;top:' +
+    top + 'px;width:' + (right - left) + 'px;height:' + (bottom - top) + 'px';
+document.documentElement.appendChild(box);
+var scale = window.devicePixelRatio || 1;
+return {
+    box: box,
+    x: Math.round(left * scale),
+    y: Math.round(top * scale),
+    frame_width: Math.round(window.innerWidth * scale),
+    frame_height: Math.round(window.innerHeight * scale)
+};
+"""
+
+REMOVE_CAPTURE_REGION_JS = """
+var box = document.getElementById('__capture_region');
+if (box) box.remove();
+"""
+
+
+def capture_region(driver, element, padding=CAPTURE_REGION_PADDING):
+    """Screenshot an element's bounding box plus ``padding`` CSS pixels.
+
+    Returns the PNG bytes and the region's position in screenshot pixels,
+    or ``(None, None)`` if the element has no visible box or the capture
+    fails, in which case the caller takes a full frame.
+    """
+    try:
+        region = driver.execute_script(CAPTURE_REGION_JS, element, padding)
+        if not region:
+            return None, None
+        try:
+            png_bytes = region.pop("box").screenshot_as_png
+        finally:
+            driver.execute_script(REMOVE_CAPTURE_REGION_JS)
+        return png_bytes, region
     except Exception as e:
-        return jsonify({
-            "error": f"Error browsing website: {str(e)}",
-            "url": url
-        }), 500
+        print(f"Region capture failed, taking the full viewport: {e}")
+        return None, None
+
+
+def scan_interactive_elements(driver, groups=None, limit=None):
+    """Find visible interactive elements and their details in one script call"""
+    groups = groups or SCAN_GROUPS
+    limit = MAX_INTERACTIVE_ELEMENTS if limit is None else limit
+    try:
+        with timed("scan"):
+            candidates = driver.execute_script(
+                ELEMENT_SCAN_JS, groups, SCAN_TEXT_LENGTH
+            ) or []
+    except Exception as e:
+        print(f"Error finding elements: {e}")
+        return []
+    return candidates[:limit]
+
+
+# Replays the value already typed into a field one slice per animation
+# frame; it only repaints the field and fires no input events
+TYPING_ANIMATION_JS = """
+var element = arguments[0];
+var duration = Math.max(1, arguments[1]);
+var done = arguments[arguments.length - 1];
+var text = element.value;
+var start = null;
+function frame(now) {
+    if (start === null) { start = now; }
+    var shown = Math.min(text.length,
+        Math.ceil(text.length * (now - start) / duration));
+    element.value = text.slice(0, shown);
+    if (shown < text.length) {
+        requestAnimationFrame(frame);
+    } else {
+        element.value = text;
+        done(true);
+    }
+}
+requestAnimationFrame(frame);
+"""
+
+
+def typing_settings(settings=None, default_mode=None):
+    """Merge per-request typing settings over the configured defaults"""
+    settings = dict(settings or {})
+    mode = settings.get("mode") or default_mode or TYPING_MODE
+    if mode not in TYPING_MODES:
+        raise BrowseError(
+            f"Unknown typing mode: {mode}; expected one of {', '.join(TYPING_MODES)}",
+            status_code=400
+        )
+    return {
+        "mode": mode,
+        "delay_ms": max(0, int(settings.get("delay_ms", TYPING_DELAY_MS))),
+        "chunk_size": max(1, int(settings.get("chunk_size", TYPING_CHUNK_SIZE)))
+    }
+
+
+def type_text(driver, element, text, settings=None):
+    """Type ``text`` into ``element`` in as few WebDriver calls as possible.
+
+    ``instant`` sends the whole string at once, ``chunked`` sends it in
+    chunks with a pause between them for pages that react to each input
+    event, and ``animate`` sends it at once then replays it visually in the
+    page. Artificial delay is capped at TYPING_MAX_DURATION_MS per field
+    and a delay of 0 always types instantly.
+    """
+    with timed("typing"):
+        settings = settings or typing_settings()
+        delay_ms = settings["delay_ms"]
+        if settings["mode"] == "instant" or delay_ms == 0 or len(text) < 2:
+            element.send_keys(text)
+            return
+        duration = min(len(text) * delay_ms, TYPING_MAX_DURATION_MS) / 1000
+
+        if settings["mode"] == "chunked":
+            size = settings["chunk_size"]
+            chunks = [text[i:i + size] for i in range(0, len(text), size)]
+            pause = duration / max(1, len(chunks) - 1)
+            for index, chunk in enumerate(chunks):
+                if index:
+                    time.sleep(pause)
+                element.send_keys(chunk)
+            return
+
+        element.send_keys(text)
+        try:
+            driver.execute_async_script(
+                TYPING_ANIMATION_JS, element, int(duration * 1000)
+            )
+        except Exception as e:
+            print(f"Typing animation skipped: {e}")
+
+
+class EncodedFrame:
+    """A screenshot written to disk and the thumbnail used to compare it.
+
+    ``patch`` is set when the file holds only part of the viewport: its
+    ``x``, ``y``, ``width`` and ``height`` in screenshot pixels and the
+    ``frame_width`` and ``frame_height`` of the full frame it is drawn
+    over. ``image`` keeps the full decoded frame for diff captures.
+    """
+
+    def __init__(self, path, thumbnail, patch=None, image=None):
+        self.path = path
+        self.thumbnail = thumbnail
+        self.patch = patch
+        self.image = image
+
+
+def frame_thumbnail(image):
+    """Small grayscale copy of a frame for perceptual comparison"""
+    return image.convert("L").resize(FRAME_THUMBNAIL_SIZE)
+
+
+def changed_box(previous, image, tile=CAPTURE_TILE_SIZE):
+    """Tile-aligned bounding box of the pixels that changed, or None"""
+    mask = ImageChops.difference(previous, image).convert("L").point(
+        lambda value: 255 if value > FRAME_PIXEL_TOLERANCE else 0
+    )
+    box = mask.getbbox()
+    if box is None:
+        return None
+    left, top, right, bottom = box
+    return (
+        left // tile * tile,
+        top // tile * tile,
+        min(image.width, -(-right // tile) * tile),
+        min(image.height, -(-bottom // tile) * tile)
+    )
+
+
+def frames_match(first, second, threshold):
+    """Whether two frame thumbnails differ in at most ``threshold`` of pixels"""
+    histogram = ImageChops.difference(first, second).histogram()
+    changed = sum(histogram[FRAME_PIXEL_TOLERANCE + 1:])
+    return changed <= threshold * sum(histogram)
+
+
+class ScreenshotEncoder:
+    """Encodes and writes screenshots on a background thread pool.
+
+    Frames are captured as in-memory PNG bytes so the walk can move on to
+    the next step immediately; conversion to the configured format and the
+    disk write happen here. A frame that perceptually matches the frame
+    before it is not written at all and resolves to the earlier frame.
+
+    A ``region`` frame is already clipped to part of the viewport and is
+    written as a patch at the region's position. A ``diff`` frame is
+    compared with the previous full frame and only the bounding box of the
+    changed tiles is written.
+    """
+
+    EXTENSIONS = {"png": "png", "jpeg": "jpg", "webp": "webp"}
+
+    def __init__(self, image_format, quality, workers):
+        self.image_format = image_format
+        self.quality = quality
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, workers), thread_name_prefix="screenshot-encoder"
+        )
+
+    def submit(self, png_bytes, base_path, image_format=None, quality=None,
+               previous=None, dedup_threshold=None, timer=None, region=None,
+               diff=False, keep_image=False):
+        """Queue a frame for encoding; the future resolves to an EncodedFrame.
+
+        ``previous`` is the future of the frame captured just before this
+        one. Frames of one walk are submitted in order, so it has always
+        started encoding by the time this frame waits on it. Encoding time
+        is reported to ``timer``, the PhaseTimer of the submitting request.
+        ``keep_image`` holds the decoded frame for the next diff to compare.
+        """
+        image_format = (image_format or self.image_format).lower()
+        if image_format == "jpg":
+            image_format = "jpeg"
+        if image_format not in self.EXTENSIONS:
+            raise BrowseError(
+                f"Unsupported screenshot format: {image_format}", status_code=400
+            )
+        quality = self.quality if quality is None else int(quality)
+        return self._executor.submit(
+            self._encode, png_bytes, base_path, image_format, quality,
+            previous, dedup_threshold, timer, region, diff, keep_image
+        )
+
+    def _encode(self, png_bytes, base_path, image_format, quality,
+                previous, dedup_threshold, timer=None, region=None,
+                diff=False, keep_image=False):
+        started = time.monotonic()
+        waited = 0.0
+        try:
+            image = Image.open(io.BytesIO(png_bytes))
+            image.load()
+            path = base_path.with_name(
+                f"{base_path.name}.{self.EXTENSIONS[image_format]}"
+            )
+            if region is not None:
+                # Drawn over whatever frame precedes it, so never compared
+                patch = dict(region, width=image.width, height=image.height)
+                self._write(image, png_bytes, path, image_format, quality)
+                return EncodedFrame(path, None, patch)
+
+            thumbnail = frame_thumbnail(image)
+            if keep_image:
+                image = image.convert("RGB")
+            dedup = dedup_threshold is not None and dedup_threshold >= 0
+            prior = None
+            if previous is not None and (dedup or diff):
+                # Time spent waiting on the previous frame is not encoding
+                wait_started = time.monotonic()
+                try:
+                    prior = previous.result()
+                except Exception:
+                    prior = None
+                waited = time.monotonic() - wait_started
+            if (dedup and prior is not None and prior.thumbnail is not None and
+                    frames_match(prior.thumbnail, thumbnail, dedup_threshold)):
+                return prior
+
+            patch = None
+            if (diff and prior is not None and prior.image is not None and
+                    prior.image.size == image.size):
+                box = changed_box(prior.image, image)
+                if box is None:
+                    return prior
+                width, height = box[2] - box[0], box[3] - box[1]
+                if width * height <= CAPTURE_DIFF_MAX_AREA * image.width * image.height:
+                    patch = {
+                        "x": box[0],
+                        "y": box[1],
+                        "width": width,
+                        "height": height,
+                        "frame_width": image.width,
+                        "frame_height": image.height
+                    }
+            if patch is None:
+                self._write(image, png_bytes, path, image_format, quality)
+            else:
+                self._write(image.crop(box), None, path, image_format, quality)
+            return EncodedFrame(
+                path, thumbnail, patch, image if keep_image else None
+            )
+        finally:
+            record_phase("encode", time.monotonic() - started - waited, timer)
+
+    def _write(self, image, png_bytes, path, image_format, quality):
+        if image_format == "png" and png_bytes is not None:
+            # The driver already produced a PNG, so write it unchanged
+            path.write_bytes(png_bytes)
+            return
+        if image_format == "jpeg":
+            image = image.convert("RGB")
+        image.save(path, format=image_format.upper(), quality=quality)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+screenshot_encoder = ScreenshotEncoder(
+    SCREENSHOT_FORMAT, SCREENSHOT_QUALITY, SCREENSHOT_ENCODER_THREADS
+)
+
+
+class VisualRecorder:
+    """Collects the frames and step metadata of one visual walk.
+
+    ``listener`` is called with a step event as soon as each frame has been
+    encoded, and setting ``cancel_event`` stops the walk at its next step.
+    ``capture_mode`` decides how steps that target an element are captured.
+    """
+
+    def __init__(self, driver, visual_dir, timestamp, image_format=None,
+                 quality=None, dedup_threshold=FRAME_DEDUP_THRESHOLD,
+                 listener=None, cancel_event=None, capture_mode="full"):
+        self.driver = driver
+        self.capture_mode = capture_mode
+        self.listener = listener
+        self.cancel_event = cancel_event
+        self.visual_dir = visual_dir
+        self.timestamp = timestamp
+        self.image_format = image_format
+        self.quality = quality
+        self.dedup_threshold = dedup_threshold
+        self.frames = []
+        self._last_digest = None
+        self._steps_emitted = threading.Semaphore(0)
+        self.started = time.monotonic()
+        self.captured_at = []
+        self.descriptions = []
+        self.cursor_positions = []
+        self.interactions = []
+
+    def record(self, name, description, interaction, cursor=None, element=None):
+        """Capture the viewport, or part of it for an ``element`` step, and
+        queue it for encoding"""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise BrowseCancelled()
+        png_bytes = region = None
+        with timed("screenshot"):
+            if element is not None and self.capture_mode == "region":
+                png_bytes, region = capture_region(self.driver, element)
+            if png_bytes is None:
+                png_bytes = self.driver.get_screenshot_as_png()
+        self.captured_at.append((time.monotonic() - self.started) * 1000)
+        previous = self.frames[-1] if self.frames else None
+        digest = hashlib.sha1(png_bytes)
+        if region is not None:
+            # The same pixels at another position are a different patch
+            digest.update(json.dumps(region, sort_keys=True).encode("utf-8"))
+        digest = digest.digest()
+        if previous is not None and digest == self._last_digest:
+            # Byte-identical to the previous frame, share it without decoding
+            frame = previous
+        else:
+            frame = screenshot_encoder.submit(
+                png_bytes,
+                self.visual_dir / f"{name}_{self.timestamp}",
+                self.image_format,
+                self.quality,
+                previous,
+                self.dedup_threshold,
+                current_timer(),
+                region=region,
+                diff=element is not None and self.capture_mode == "diff",
+                keep_image=self.capture_mode == "diff"
+            )
+        self._last_digest = digest
+        self.frames.append(frame)
+        self.descriptions.append(description)
+        self.cursor_positions.append(cursor)
+        self.interactions.append(interaction)
+        if self.listener is not None:
+            step = {
+                "index": len(self.frames) - 1,
+                "description": description,
+                "cursor_position": cursor,
+                "interaction": interaction
+            }
+            frame.add_done_callback(
+                lambda done, step=step: self._emit_step(step, done)
+            )
+
+    def _emit_step(self, step, frame):
+        try:
+            step["screenshot"] = str(frame.result().path.relative_to(DATA_DIR))
+            step["patch"] = frame.result().patch
+        except Exception as e:
+            print(f"Error encoding frame {step['index']}: {e}")
+            step["screenshot"] = None
+            step["patch"] = None
+        try:
+            self.listener(step)
+        finally:
+            self._steps_emitted.release()
+
+    def finish(self):
+        """Wait for pending frames and return the visual feedback lists"""
+        # Create relative paths for frontend; duplicate frames share a path
+        screenshots = [
+            str(frame.result().path.relative_to(DATA_DIR)) for frame in self.frames
+        ]
+        patches = [frame.result().patch for frame in self.frames]
+        for frame in self.frames:
+            # Decoded frames were only kept for the next diff
+            frame.result().image = None
+        if self.listener is not None:
+            # Frame callbacks run just after the result is set, so make sure
+            # every step has reached the listener before reporting completion
+            for _ in self.frames:
+                self._steps_emitted.acquire()
+        return {
+            "screenshots": screenshots,
+            "patches": patches,
+            "unique_frames": len(set(screenshots)),
+            "descriptions": self.descriptions,
+            "cursor_positions": self.cursor_positions,
+            "interactions": self.interactions
+        }
+
+    def write_recording(self, image_format, keep_frames=True):
+        """Combine the walk's frames into one animated file and a frame index.
+
+        Call after finish(). Consecutive duplicate frames become one longer
+        frame, and each frame is shown for its real capture gap clamped to
+        RECORDING_MIN_FRAME_MS..RECORDING_MAX_FRAME_MS. The index maps every
+        step to its capture offset, playback start and animation frame.
+        Patches are composited over the frame before them. Without
+        ``keep_frames`` the individual screenshots are deleted.
+        """
+        paths = [frame.result().path for frame in self.frames]
+        patches = [frame.result().patch for frame in self.frames]
+        if not paths:
+            return None
+        groups = []
+        steps = []
+        playback = 0
+        for i, path in enumerate(paths):
+            if i + 1 < len(paths):
+                gap = self.captured_at[i + 1] - self.captured_at[i]
+            else:
+                gap = RECORDING_MAX_FRAME_MS
+            duration = int(min(RECORDING_MAX_FRAME_MS, max(RECORDING_MIN_FRAME_MS, gap)))
+            if not groups or groups[-1][0] != path:
+                groups.append([path, 0, patches[i]])
+            groups[-1][1] += duration
+            steps.append({
+                "index": i,
+                "frame": len(groups) - 1,
+                "captured_ms": round(self.captured_at[i]),
+                "start_ms": playback,
+                "duration_ms": duration,
+                "description": self.descriptions[i],
+                "cursor_position": self.cursor_positions[i],
+                "interaction": self.interactions[i]
+            })
+            playback += duration
+
+        extension = "webp" if image_format == "webp" else "png"
+        target = self.visual_dir / f"recording_{self.timestamp}.{extension}"
+        with timed("recording"):
+            images = []
+            for path, _, patch in groups:
+                image = Image.open(path).convert("RGB")
+                if patch is not None and images:
+                    canvas = images[-1].copy()
+                    canvas.paste(image, (patch["x"], patch["y"]))
+                    image = canvas
+                images.append(image)
+            save_options = {
+                "save_all": True,
+                "append_images": images[1:],
+                "duration": [duration for _, duration, _ in groups],
+                "loop": 0
+            }
+            if image_format == "webp":
+                # libwebp stores each frame as the changed rectangle over
+                # the previous one, so static areas are encoded once
+                images[0].save(
+                    target, format="WEBP", quality=RECORDING_QUALITY, **save_options
+                )
+            else:
+                images[0].save(target, format="PNG", **save_options)
+
+        index = {
+            "format": image_format,
+            "frames": len(groups),
+            "duration_ms": playback,
+            "steps": steps
+        }
+        index_path = target.with_suffix(".json")
+        index_path.write_text(json.dumps(index))
+
+        if not keep_frames:
+            for path, _, _ in groups:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+        return dict(
+            index,
+            path=str(target.relative_to(DATA_DIR)),
+            index_path=str(index_path.relative_to(DATA_DIR)),
+            bytes=target.stat().st_size
+        )
+
+
+def navigate(pooled, url, ready=wait_for_page_ready):
+    """Load a URL, replacing the pooled driver once if the session is broken"""
+    try:
+        pooled.pages_served += 1
+        with timed("navigate"):
+            pooled.driver.get(url)
+        ready(pooled.driver)
+    except Exception as e:
+        # If navigation fails, swap in a warm driver and try again
+        print(f"Navigation failed on driver {pooled.id}: {str(e)}, reinitializing driver")
+        pooled.pool.replace(pooled)
+        if pooled.restore_state is not None:
+            pooled.restore_state(pooled.driver)
+        with timed("navigate"):
+            pooled.driver.get(url)
+        ready(pooled.driver)
+
+
+def run_visual_walk(pooled, url, options=None, listener=None, cancel_event=None):
+    """Walk a page with a checked-out driver.
+
+    Returns the page data and the recorder holding the walk's frames, which
+    may still be encoding in the background.
+    """
+    options = options or {}
+    typing = typing_settings(options.get("typing"))
+    capture_mode = options.get("capture", CAPTURE_MODE)
+    if capture_mode not in CAPTURE_MODES:
+        raise BrowseError(
+            f"Unsupported capture mode: {capture_mode}; expected one of "
+            f"{', '.join(CAPTURE_MODES)}",
+            status_code=400
+        )
+    # Create directory for screenshots; the pool name and driver id keep
+    # concurrent walks started in the same second apart
+    timestamp = int(time.time())
+    visual_dir = SCREENSHOTS_DIR / f"visual_{timestamp}_{pooled.pool.name}_{pooled.id}"
+    visual_dir.mkdir(exist_ok=True)
+    
+    navigate(pooled, url)
+    driver = pooled.driver
+    recorder = VisualRecorder(
+        driver, visual_dir, timestamp,
+        image_format=options.get("screenshot_format"),
+        quality=options.get("screenshot_quality"),
+        dedup_threshold=(
+            FRAME_DEDUP_THRESHOLD if options.get("dedupe", True) else None
+        ),
+        listener=listener,
+        cancel_event=cancel_event,
+        capture_mode=capture_mode
+    )
+    
+    # Inject cursor visualization
+    cursor_js = """
+    var cursor = document.createElement('div');
+    cursor.id = 'selenium-mouse-cursor';
+    cursor.style.position = 'absolute';
+    cursor.style.width = '20px';
+    cursor.style.height = '20px';
+    cursor.style.borderRadius = '10px';
+    cursor.style.backgroundColor = 'rgba(255, 0, 0, 0.5)';
+    cursor.style.zIndex = '9999';
+    cursor.style.pointerEvents = 'none';
+    document.body.appendChild(cursor);
+    
+    window.addEventListener('mousemove', function(e) {
+        cursor.style.left = e.clientX + 'px';
+        cursor.style.top = e.clientY + 'px';
+    });
+    """
+    driver.execute_script(cursor_js)
+    
+    # Take initial screenshot; no cursor for initial view
+    recorder.record("step_0", f"Initial page load of {url}", "page_load")
+    
+    # Create action chain for mouse movements
+    actions = ActionChains(driver)
+    
+    # Find interactive elements
+    interactive_elements = scan_interactive_elements(
+        driver, options.get("scan_groups"), options.get("max_elements")
+    )
+    
+    # First, do a general page scroll
+    for scroll_step in range(3):
+        # Scroll down smoothly
+        driver.execute_script(
+            f"""window.scrollTo({{
+                top: {(scroll_step + 1) * 300},
+                behavior: 'smooth'
+            }});"""
+        )
+        wait_for_settle(driver)
+        
+        # Take screenshot after scrolling
+        recorder.record(
+            f"scroll_{scroll_step+1}",
+            f"Scrolling down to explore content (step {scroll_step+1})",
+            "scroll",
+            {"x": 640, "y": 300 + (scroll_step * 100)}
+        )
+    
+    # Scroll back to top
+    driver.execute_script("window.scrollTo({top: 0, behavior: 'smooth'});")
+    wait_for_settle(driver)
+    
+    # Interact with elements
+    for i, candidate in enumerate(interactive_elements):
+        element = candidate["element"]
+        tag_name = candidate["tag"]
+        element_text = candidate["text"]
+        element_type = candidate["type"]
+        element_name = candidate["name"]
+        try:
+            # Scroll element into view if it is still visible
+            if not driver.execute_script(SCROLL_TO_ELEMENT_JS, element):
+                continue
+            wait_for_settle(driver)
+            
+            # Get element position and state for cursor tracking
+            state = driver.execute_script(ELEMENT_STATE_JS, element)
+            cursor = {"x": state['x'], "y": state['y']}
+            
+            # Take screenshot after scrolling
+            if tag_name == "a":
+                description = f"Scrolled to link: {element_text}"
+            elif tag_name == "button":
+                description = f"Scrolled to button: {element_text}"
+            elif tag_name == "input":
+                description = f"Scrolled to input field of type: {element_type}"
+            else:
+                description = f"Scrolled to {tag_name} element"
+            recorder.record(
+                f"step_{i+1}_scroll", description, "scroll_to_element", cursor
+            )
+            
+            # Move cursor to element
+            actions.move_to_element(element).perform()
+            wait_for_animation_frames(driver)
+            
+            # Take screenshot with cursor hovering
+            if tag_name == "a":
+                description = f"Hovering over link: {element_text}"
+                interaction = "hover_link"
+            elif tag_name == "button":
+                description = f"Hovering over button: {element_text}"
+                interaction = "hover_button"
+            elif tag_name == "input":
+                description = f"Hovering over input field of type: {element_type}"
+                interaction = "hover_input"
+            else:
+                description = f"Hovering over {tag_name} element"
+                interaction = "hover_element"
+            recorder.record(
+                f"step_{i+1}_hover", description, interaction, cursor, element
+            )
+            
+            # For input elements, simulate typing
+            if (tag_name == "input" and
+                    state['visible'] and
+                    state['enabled']):
+                if element_type in ["text", "search", "email", "password"]:
+                    try:
+                        # Click on the input field
+                        actions.click().perform()
+                        wait_for_animation_frames(driver)
+                        
+                        # Take screenshot after clicking
+                        recorder.record(
+                            f"step_{i+1}_click",
+                            f"Clicked on {element_type} field",
+                            "click_input",
+                            cursor,
+                            element
+                        )
+                        
+                        # Clear the field
+                        element.clear()
+                        
+                        # Determine what text to type
+                        sample_text = "Sample text for demonstration"
+                        if "search" in element_type.lower() or "search" in element_name.lower():
+                            sample_text = "search query example"
+                        elif "email" in element_type.lower():
+                            sample_text = "example@email.com"
+                        elif "password" in element_type.lower():
+                            sample_text = "••••••••"
+                        
+                        type_text(driver, element, sample_text, typing)
+                        
+                        # Take screenshot after typing
+                        recorder.record(
+                            f"step_{i+1}_typing",
+                            f"Typing in {element_type}: '{sample_text}'",
+                            "typing",
+                            cursor,
+                            element
+                        )
+                    except Exception as e:
+                        print(f"Error typing in element {i}: {e}")
+            
+            # For links and buttons, simulate clicking on the last one
+            elif tag_name in ["a", "button"] and i == len(interactive_elements) - 1:
+                try:
+                    # Take screenshot before clicking
+                    recorder.record(
+                        f"step_{i+1}_pre_click",
+                        f"About to click {tag_name}: {element_text}",
+                        "pre_click",
+                        cursor,
+                        element
+                    )
+                    
+                    # Click the element
+                    actions.click().perform()
+                    wait_for_page_ready(driver)
+                    
+                    # Take screenshot after clicking
+                    recorder.record(
+                        f"step_{i+1}_post_click",
+                        f"After clicking {tag_name}: {element_text}",
+                        "post_click"
+                    )
+                except Exception as e:
+                    print(f"Error clicking element {i}: {e}")
+        except Exception as e:
+            print(f"Error interacting with element {i}: {e}")
+    
+    # Take final screenshot
+    recorder.record("step_final", "Final view of the page", "final_view")
+    
+    # Outline the page content in one script call
+    title = driver.title
+    
+    # Prepare result; the frame lists are added once encoding finishes
+    result_data = {
+        "title": title,
+        "url": url,
+        "outline": capture_outline(driver, options),
+        "timestamp": timestamp
+    }
+    
+    return result_data, recorder
+
+
+PAGE_EXTRACT_JS = """
+var textLimit = arguments[0];
+var linkLimit = arguments[1];
+function meta(selector) {
+    var el = document.querySelector(selector);
+    return el ? (el.getAttribute('content') || el.getAttribute('href')) : null;
+}
+var text = document.body ? document.body.innerText : '';
+var links = [];
+var seen = {};
+var anchors = document.querySelectorAll('a[href]');
+for (var i = 0; i < anchors.length && links.length < linkLimit; i++) {
+    var href = anchors[i].href;
+    if (!href || href.indexOf('javascript:') === 0 || seen[href]) {
+        continue;
+    }
+    seen[href] = true;
+    links.push({
+        text: (anchors[i].innerText || anchors[i].title || '').trim().slice(0, 200),
+        href: href
+    });
+}
+return {
+    title: document.title,
+    final_url: location.href,
+    text: text.slice(0, textLimit),
+    text_truncated: text.length > textLimit,
+    links: links,
+    metadata: {
+        description: meta('meta[name="description"]'),
+        keywords: meta('meta[name="keywords"]'),
+        canonical: meta('link[rel="canonical"]'),
+        og_title: meta('meta[property="og:title"]'),
+        og_description: meta('meta[property="og:description"]'),
+        og_image: meta('meta[property="og:image"]'),
+        language: document.documentElement.lang || null
+    }
+};
+"""
+
+
+# Builds a compact outline of the page's accessibility tree in one pass:
+# landmarks (which indent their contents), headings, links, buttons, form
+# fields, tables and text blocks, skipping hidden subtrees
+OUTLINE_JS = """
+var maxItems = arguments[0];
+var textLength = arguments[1];
+var tableRows = arguments[2];
+var LANDMARK_TAGS = {HEADER: 'banner', NAV: 'navigation', MAIN: 'main',
+    ASIDE: 'complementary', FOOTER: 'contentinfo', FORM: 'form'};
+var LANDMARK_ROLES = {banner: 1, navigation: 1, main: 1, complementary: 1,
+    contentinfo: 1, form: 1, search: 1, region: 1, dialog: 1};
+var SKIP = {SCRIPT: 1, STYLE: 1, NOSCRIPT: 1, TEMPLATE: 1, SVG: 1, svg: 1,
+    CANVAS: 1, IFRAME: 1, OBJECT: 1, VIDEO: 1, AUDIO: 1, HEAD: 1};
+var BLOCK_TEXT = {P: 1, LI: 1, DT: 1, DD: 1, BLOCKQUOTE: 1, FIGCAPTION: 1,
+    PRE: 1, SUMMARY: 1, LABEL: 1};
+var items = [];
+var seenLinks = {};
+var truncated = false;
+
+function clip(value) {
+    value = (value || '').replace(/\\s+/g, ' ').trim();
+    return value.length > textLength ? value.slice(0, textLength - 1) + '…' : value;
+}
+function push(depth, line) {
+    if (items.length >= maxItems) {
+        truncated = true;
+        return;
+    }
+    items.push(new Array(depth + 1).join('  ') + line);
+}
+function hidden(el) {
+    if (el.hidden || el.getAttribute('aria-hidden') === 'true') {
+        return true;
+    }
+    var style = getComputedStyle(el);
+    return style.display === 'none' || style.visibility === 'hidden';
+}
+function labelledBy(el) {
+    var ids = (el.getAttribute('aria-labelledby') || '').split(/\\s+/);
+    var parts = [];
+    for (var i = 0; i < ids.length; i++) {
+        var target = ids[i] && document.getElementById(ids[i]);
+        if (target) {
+            parts.push(target.innerText || target.textContent);
+        }
+    }
+    return parts.join(' ');
+}
+function name(el, useText) {
+    var label = el.getAttribute('aria-label') || labelledBy(el);
+    if (!label && el.labels && el.labels.length) {
+        label = el.labels[0].innerText;
+    }
+    var image = useText && el.querySelector('img[alt]');
+    return clip(label || el.getAttribute('title') || el.getAttribute('alt') ||
+        (useText ? el.innerText : '') || el.getAttribute('placeholder') ||
+        el.getAttribute('name') || (image ? image.getAttribute('alt') : ''));
+}
+function shortHref(href) {
+    try {
+        var parsed = new URL(href, location.href);
+        return parsed.origin === location.origin ?
+            parsed.pathname + parsed.search + parsed.hash : parsed.href;
+    } catch (e) {
+        return href;
+    }
+}
+function field(el, depth) {
+    var tag = el.tagName;
+    var type = (el.getAttribute('type') || 'text').toLowerCase();
+    if (tag === 'INPUT' && type === 'hidden') {
+        return;
+    }
+    if (tag === 'INPUT' && (type === 'submit' || type === 'button' || type === 'reset')) {
+        push(depth, '[button] ' + clip(el.value || name(el, false)));
+        return;
+    }
+    var kind = tag === 'SELECT' ? 'select' : tag === 'TEXTAREA' ? 'textbox' :
+        (type === 'checkbox' || type === 'radio') ? type : type === 'text' ? 'textbox' : type;
+    var line = '[' + kind + '] ' + name(el, false);
+    if (kind === 'checkbox' || kind === 'radio') {
+        line += el.checked ? ' (checked)' : '';
+    } else if (tag === 'SELECT') {
+        var selected = el.options[el.selectedIndex];
+        line += ' = ' + clip(selected ? selected.text : '') + ' (' + el.options.length + ' options)';
+    } else if (type !== 'password' && el.value) {
+        line += ' = "' + clip(el.value) + '"';
+    }
+    if (el.required) {
+        line += ' (required)';
+    }
+    push(depth, line);
+}
+function table(el, depth) {
+    var rows = el.rows || [];
+    var caption = el.caption ? clip(el.caption.innerText) : name(el, false);
+    push(depth, '[table] ' + (caption ? caption + ' ' : '') + '(' + rows.length + ' rows)');
+    for (var r = 0; r < rows.length && r < tableRows; r++) {
+        var cells = [];
+        for (var c = 0; c < rows[r].cells.length; c++) {
+            cells.push(clip(rows[r].cells[c].innerText));
+        }
+        push(depth + 1, '| ' + cells.join(' | ') + ' |');
+    }
+}
+function walk(el, depth, inText) {
+    if (items.length >= maxItems) {
+        truncated = true;
+        return;
+    }
+    var tag = el.tagName;
+    if (SKIP[tag] || hidden(el)) {
+        return;
+    }
+    var role = el.getAttribute('role');
+    var landmark = LANDMARK_ROLES[role] ? role : LANDMARK_TAGS[tag];
+    if (!landmark && tag === 'SECTION' && (el.getAttribute('aria-label') || el.getAttribute('aria-labelledby'))) {
+        landmark = 'region';
+    }
+    if (landmark) {
+        var label = el.getAttribute('aria-label') || labelledBy(el);
+        push(depth, '[' + landmark + (label ? ' "' + clip(label) + '"' : '') + ']');
+        depth++;
+    }
+    if (/^H[1-6]$/.test(tag) || role === 'heading') {
+        var level = /^H[1-6]$/.test(tag) ? +tag.charAt(1) : +(el.getAttribute('aria-level') || 2);
+        push(depth, new Array(level + 1).join('#') + ' ' + clip(el.innerText));
+        return;
+    }
+    if (tag === 'A' && el.getAttribute('href') && el.href.indexOf('javascript:') !== 0) {
+        var text = name(el, true);
+        var key = text + ' ' + el.href;
+        if (!seenLinks[key]) {
+            seenLinks[key] = true;
+            push(depth, '[link] ' + text + ' -> ' + shortHref(el.href));
+        }
+        return;
+    }
+    if (tag === 'BUTTON' || role === 'button') {
+        push(depth, '[button] ' + name(el, true));
+        return;
+    }
+    if (tag === 'INPUT' || tag === 'SELECT' || tag === 'TEXTAREA') {
+        field(el, depth);
+        return;
+    }
+    if (tag === 'TABLE') {
+        table(el, depth);
+        return;
+    }
+    if (tag === 'IMG' && !inText) {
+        var alt = clip(el.getAttribute('alt'));
+        if (alt) {
+            push(depth, '[image] ' + alt);
+        }
+        return;
+    }
+    if (!inText) {
+        if (BLOCK_TEXT[tag]) {
+            var block = clip(el.innerText);
+            if (block) {
+                push(depth, block);
+            }
+            inText = true;
+        } else {
+            var own = '';
+            for (var node = el.firstChild; node; node = node.nextSibling) {
+                if (node.nodeType === 3) {
+                    own += node.nodeValue;
+                }
+            }
+            own = clip(own);
+            if (own.length > 1) {
+                push(depth, own);
+            }
+        }
+    }
+    for (var child = el.firstElementChild; child; child = child.nextElementSibling) {
+        walk(child, depth, inText);
+    }
+}
+if (document.body) {
+    walk(document.body, 0, false);
+}
+return {
+    title: document.title,
+    final_url: location.href,
+    language: document.documentElement.lang || null,
+    items: items,
+    truncated: truncated
+};
+"""
+
+
+def outline_page(items, cursor=0, budget=OUTLINE_BYTE_BUDGET):
+    """Take outline lines from ``cursor`` until ``budget`` bytes are used"""
+    cursor = max(0, cursor)
+    lines = []
+    used = 0
+    index = cursor
+    while index < len(items):
+        size = len(items[index].encode("utf-8")) + 1
+        if lines and used + size > budget:
+            break
+        lines.append(items[index])
+        used += size
+        index += 1
+    return {
+        "outline": "\n".join(lines),
+        "cursor": cursor,
+        "next_cursor": index if index < len(items) else None,
+        "total_items": len(items),
+        "bytes": used
+    }
+
+
+class OutlineStore:
+    """Keeps recent page outlines in memory so later pages can be read
+    with a cursor without browsing the page again"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, snapshot, snapshot_id=None):
+        """Store a snapshot under a new id, or under ``snapshot_id`` when a
+        cached result brings an evicted one back"""
+        snapshot_id = snapshot_id or uuid.uuid4().hex
+        with self._lock:
+            self._snapshots[snapshot_id] = snapshot
+            while len(self._snapshots) > self.max_entries:
+                self._snapshots.popitem(last=False)
+        return snapshot_id
+
+    def get(self, snapshot_id):
+        with self._lock:
+            snapshot = self._snapshots.get(snapshot_id)
+            if snapshot is not None:
+                self._snapshots.move_to_end(snapshot_id)
+            return snapshot
+
+
+outline_store = OutlineStore(OUTLINE_SNAPSHOTS)
+
+
+def capture_outline(driver, options=None):
+    """Outline the current page and return its first page of lines"""
+    options = options or {}
+    with timed("outline"):
+        snapshot = driver.execute_script(
+            OUTLINE_JS, OUTLINE_MAX_ITEMS, OUTLINE_TEXT_LENGTH, OUTLINE_TABLE_ROWS
+        )
+    page = outline_page(
+        snapshot["items"],
+        int(options.get("outline_cursor", 0)),
+        int(options.get("outline_budget", OUTLINE_BYTE_BUDGET))
+    )
+    page["snapshot_id"] = outline_store.put(snapshot)
+    page["truncated"] = snapshot["truncated"]
+    return page
+
+
+def perform_extract(url, options=None):
+    """Load a page on a headless driver and return its text, links and metadata"""
+    options = options or {}
+    timestamp = int(time.time())
+    screenshot = None
+    with get_pool(True, options.get("profile")).checkout() as pooled:
+        with session_state(pooled, url, options):
+            # driver.get already waits for the load event, so only confirm the
+            # document is complete instead of waiting for network idle
+            navigate(pooled, url, ready=wait_for_document_ready)
+            if options.get("format") == "outline":
+                outline = capture_outline(pooled.driver, options)
+                result_data = {
+                    "title": pooled.driver.title,
+                    "final_url": pooled.driver.current_url,
+                    "outline": outline
+                }
+            else:
+                with timed("extract"):
+                    result_data = pooled.driver.execute_script(
+                        PAGE_EXTRACT_JS,
+                        int(options.get("text_limit", EXTRACT_TEXT_LIMIT)),
+                        int(options.get("link_limit", EXTRACT_LINK_LIMIT))
+                    )
+            if options.get("screenshot"):
+                screenshot = screenshot_encoder.submit(
+                    pooled.driver.get_screenshot_as_png(),
+                    SCREENSHOTS_DIR / f"extract_{timestamp}_{pooled.id}",
+                    options.get("screenshot_format"),
+                    options.get("screenshot_quality")
+                )
+
+    result_data.update({
+        "mode": "extract",
+        "url": url,
+        "screenshot": (
+            str(screenshot.result().path.relative_to(DATA_DIR))
+            if screenshot is not None else None
+        ),
+        "timestamp": timestamp
+    })
+    return result_data
+
+
+class PlanRunner:
+    """Executes a caller-supplied list of browser steps on one driver.
+
+    Each step is a dict with an ``action`` (navigate, wait_for, click,
+    type, scroll, extract or screenshot) and its arguments. Steps run in
+    order; a failing step stops the plan unless it is marked ``optional``.
+    """
+
+    ACTIONS = ("navigate", "wait_for", "click", "type", "scroll", "extract", "screenshot")
+
+    def __init__(self, pooled, recorder, cancel_event=None, typing=None):
+        self.pooled = pooled
+        self.recorder = recorder
+        self.cancel_event = cancel_event
+        self.typing = typing or typing_settings()
+
+    @property
+    def driver(self):
+        # navigate() may swap the driver of a broken session
+        return self.pooled.driver
+
+    @classmethod
+    def validate(cls, steps):
+        """Reject malformed plans before a driver is checked out"""
+        if not isinstance(steps, list) or not steps:
+            raise BrowseError("steps must be a non-empty list", status_code=400)
+        if len(steps) > PLAN_MAX_STEPS:
+            raise BrowseError(
+                f"Plans are limited to {PLAN_MAX_STEPS} steps", status_code=400
+            )
+        for index, step in enumerate(steps):
+            if not isinstance(step, dict) or step.get("action") not in cls.ACTIONS:
+                raise BrowseError(
+                    f"Step {index} has an unknown action; expected one of "
+                    f"{', '.join(cls.ACTIONS)}",
+                    status_code=400
+                )
+            if step["action"] == "navigate" and not step.get("url"):
+                raise BrowseError(f"Step {index} navigates without a url", status_code=400)
+
+    def find(self, step, condition=EC.presence_of_element_located):
+        """Wait for the step's CSS selector and return the element"""
+        selector = step.get("selector")
+        if not selector:
+            raise BrowseError(f"{step['action']} needs a selector", status_code=400)
+        timeout = float(step.get("timeout", PAGE_READY_TIMEOUT))
+        return WebDriverWait(
+            self.driver, timeout, poll_frequency=READY_POLL_INTERVAL
+        ).until(condition((By.CSS_SELECTOR, selector)))
+
+    def do_navigate(self, step):
+        navigate(self.pooled, step["url"])
+        return {"url": self.driver.current_url, "title": self.driver.title}
+
+    def do_wait_for(self, step):
+        conditions = {
+            "present": EC.presence_of_element_located,
+            "visible": EC.visibility_of_element_located,
+            "clickable": EC.element_to_be_clickable
+        }
+        state = step.get("state", "visible")
+        if state not in conditions:
+            raise BrowseError(f"Unknown wait_for state: {state}", status_code=400)
+        self.find(step, conditions[state])
+        return {"selector": step["selector"], "state": state}
+
+    def do_click(self, step):
+        element = self.find(step, EC.element_to_be_clickable)
+        self.driver.execute_script(SCROLL_TO_ELEMENT_JS, element)
+        wait_for_settle(self.driver)
+        state = self.driver.execute_script(ELEMENT_STATE_JS, element)
+        ActionChains(self.driver).move_to_element(element).click().perform()
+        if step.get("wait") == "page":
+            wait_for_page_ready(self.driver)
+        else:
+            wait_for_animation_frames(self.driver)
+        return {"x": state["x"], "y": state["y"], "url": self.driver.current_url}
+
+    def do_type(self, step):
+        element = self.find(step, EC.element_to_be_clickable)
+        if step.get("clear", True):
+            element.clear()
+        typing = self.typing
+        if step.get("typing"):
+            typing = typing_settings(
+                dict(self.typing, **step["typing"]), self.typing["mode"]
+            )
+        type_text(self.driver, element, step.get("text", ""), typing)
+        if step.get("submit"):
+            element.send_keys(Keys.ENTER)
+            wait_for_page_ready(self.driver)
+        return {"selector": step["selector"], "length": len(step.get("text", ""))}
+
+    def do_scroll(self, step):
+        if step.get("selector"):
+            element = self.find(step)
+            self.driver.execute_script(SCROLL_TO_ELEMENT_JS, element)
+        elif "by" in step:
+            self.driver.execute_script(
+                "window.scrollBy({top: arguments[0], behavior: 'smooth'});",
+                int(step["by"])
+            )
+        else:
+            self.driver.execute_script(
+                "window.scrollTo({top: arguments[0], behavior: 'smooth'});",
+                int(step.get("y", 0))
+            )
+        wait_for_settle(self.driver)
+        return {"y": self.driver.execute_script("return window.scrollY;")}
+
+    def do_extract(self, step):
+        if step.get("format") == "outline":
+            return capture_outline(self.driver, step)
+        if not step.get("selector"):
+            return self.driver.execute_script(
+                PAGE_EXTRACT_JS,
+                int(step.get("text_limit", EXTRACT_TEXT_LIMIT)),
+                int(step.get("link_limit", EXTRACT_LINK_LIMIT))
+            )
+        self.find(step)
+        attribute = step.get("attribute")
+        values = self.driver.execute_script(
+            """
+            var nodes = document.querySelectorAll(arguments[0]);
+            var values = [];
+            for (var i = 0; i < nodes.length && i < arguments[2]; i++) {
+                values.push(arguments[1] ?
+                    nodes[i].getAttribute(arguments[1]) :
+                    (nodes[i].innerText || '').trim());
+            }
+            return values;
+            """,
+            step["selector"], attribute, int(step.get("limit", 50))
+        )
+        return {"selector": step["selector"], "values": values}
+
+    def do_screenshot(self, step):
+        # navigate() may have replaced a broken driver since the last frame
+        self.recorder.driver = self.driver
+        self.recorder.record(
+            step.get("name", f"plan_{len(self.recorder.frames)}"),
+            step.get("description", f"Screenshot of {self.driver.current_url}"),
+            "screenshot"
+        )
+        return {"frame": len(self.recorder.frames) - 1}
+
+    def run(self, steps):
+        """Run every step and return the per-step results with timings"""
+        results = []
+        for index, step in enumerate(steps):
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                raise BrowseCancelled()
+            action = step["action"]
+            started = time.monotonic()
+            entry = {"index": index, "action": action}
+            try:
+                entry["result"] = getattr(self, f"do_{action}")(step)
+                entry["status"] = "ok"
+            except BrowseCancelled:
+                raise
+            except Exception as e:
+                entry["status"] = "error"
+                entry["error"] = e.message if isinstance(e, BrowseError) else (
+                    str(e) or type(e).__name__
+                )
+            entry["duration_ms"] = round((time.monotonic() - started) * 1000, 1)
+            results.append(entry)
+            if entry["status"] == "error" and not step.get("optional"):
+                break
+        return results
+
+
+def recording_format(options):
+    """The recording format a request asked for, or None for no recording"""
+    requested = options.get("recording")
+    if not requested:
+        return None
+    image_format = RECORDING_FORMAT if requested is True else str(requested).lower()
+    if image_format not in RECORDING_FORMATS:
+        raise BrowseError(
+            f"Unsupported recording format: {image_format}; expected one of "
+            f"{', '.join(RECORDING_FORMATS)}",
+            status_code=400
+        )
+    return image_format
+
+
+def finish_visual_result(result_data, recorder, options):
+    """Add the recorder's frames, and its recording if requested, to a result"""
+    result_data.update(recorder.finish())
+    image_format = recording_format(options)
+    if image_format is None:
+        return result_data
+    keep_frames = options.get("keep_frames", True)
+    result_data["recording"] = recorder.write_recording(image_format, keep_frames)
+    if not keep_frames:
+        result_data["screenshots"] = []
+        result_data["patches"] = []
+        result_data["unique_frames"] = 0
+    return result_data
+
+
+def perform_plan(url, options, listener=None, cancel_event=None):
+    """Run an interaction plan inside a single driver checkout"""
+    steps = options.get("steps")
+    PlanRunner.validate(steps)
+    recording_format(options)
+    if url and steps[0]["action"] != "navigate":
+        steps = [{"action": "navigate", "url": url}] + steps
+
+    pool = get_pool(bool(options.get("headless")), options.get("profile"))
+    # Nobody watches a headless plan, so it types without animation
+    typing = typing_settings(
+        options.get("typing"), "instant" if options.get("headless") else None
+    )
+    timestamp = int(time.time())
+    started = time.monotonic()
+    with pool.checkout() as pooled:
+        visual_dir = SCREENSHOTS_DIR / f"visual_{timestamp}_{pooled.pool.name}_{pooled.id}"
+        visual_dir.mkdir(exist_ok=True)
+        recorder = VisualRecorder(
+            pooled.driver, visual_dir, timestamp,
+            image_format=options.get("screenshot_format"),
+            quality=options.get("screenshot_quality"),
+            listener=listener,
+            cancel_event=cancel_event
+        )
+        with session_state(pooled, url, options):
+            step_results = PlanRunner(
+                pooled, recorder, cancel_event, typing
+            ).run(steps)
+        result_data = {
+            "mode": "plan",
+            "url": url,
+            "final_url": pooled.driver.current_url,
+            "title": pooled.driver.title,
+            "steps": step_results,
+            "completed": all(
+                result["status"] == "ok" or steps[result["index"]].get("optional")
+                for result in step_results
+            ) and len(step_results) == len(steps),
+            "timestamp": timestamp
+        }
+
+    finish_visual_result(result_data, recorder, options)
+    result_data["total_ms"] = round((time.monotonic() - started) * 1000, 1)
+    return result_data
+
+
+def normalize_url(url):
+    """Canonical form of a URL for cache keys"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower() or "https"
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    path = parts.path or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def mark_session_viewed(relative_path):
+    """Record that a screenshot's session was viewed, for LRU retention"""
+    path = DATA_DIR / relative_path
+    session_dir = path.parent
+    if session_dir.parent != SCREENSHOTS_DIR:
+        return
+    try:
+        (session_dir / LAST_VIEWED_MARKER).touch()
+    except OSError:
+        pass
+
+
+class RetentionManager:
+    """Keeps the screenshots directory under a byte quota and maximum age.
+
+    Each entry directly under the screenshots directory (a ``visual_*``
+    session directory or a loose screenshot) is one session. Sessions
+    older than ``max_age`` since they were last viewed are deleted, then
+    the least recently viewed ones are evicted until usage is under
+    ``quota_bytes``. Pinned sessions are never deleted, and sessions
+    modified within ``min_age`` are skipped so running walks are safe.
+    """
+
+    def __init__(self, root, quota_bytes, max_age, interval, min_age):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.max_age = max_age
+        self.interval = interval
+        self.min_age = min_age
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.last_run = None
+        self.usage_bytes = 0
+        self.sessions = 0
+        self.pinned = 0
+        self.evicted_sessions = 0
+        self.evicted_bytes = 0
+
+    def _describe(self, entry):
+        """Size, last view time and pin state of one session"""
+        if entry.is_dir():
+            size = 0
+            modified = None
+            for path in entry.rglob("*"):
+                # Markers would make every viewed session look freshly written
+                if path.is_file() and path.name not in (LAST_VIEWED_MARKER, PINNED_MARKER):
+                    stat = path.stat()
+                    size += stat.st_size
+                    modified = max(modified or 0, stat.st_mtime)
+            if modified is None:
+                modified = entry.stat().st_mtime
+            marker = entry / LAST_VIEWED_MARKER
+            last_viewed = marker.stat().st_mtime if marker.exists() else modified
+            pinned = (entry / PINNED_MARKER).exists()
+        else:
+            stat = entry.stat()
+            size = stat.st_size
+            modified = last_viewed = stat.st_mtime
+            pinned = False
+        return {
+            "name": entry.name,
+            "path": entry,
+            "size": size,
+            "modified": modified,
+            "last_viewed": max(last_viewed, modified),
+            "pinned": pinned
+        }
+
+    def _delete(self, session):
+        try:
+            if session["path"].is_dir():
+                shutil.rmtree(session["path"])
+            else:
+                session["path"].unlink()
+        except OSError as e:
+            print(f"Error deleting screenshot session {session['name']}: {e}")
+            return False
+        self.evicted_sessions += 1
+        self.evicted_bytes += session["size"]
+        return True
+
+    def run_once(self):
+        """Apply the age limit and quota once and refresh the usage stats"""
+        with self._lock:
+            now = time.time()
+            sessions = []
+            for entry in self.root.iterdir():
+                try:
+                    sessions.append(self._describe(entry))
+                except OSError:
+                    continue
+
+            kept = []
+            for session in sessions:
+                expired = (
+                    self.max_age > 0 and
+                    now - session["last_viewed"] > self.max_age
+                )
+                if expired and not session["pinned"] and self._delete(session):
+                    continue
+                kept.append(session)
+
+            usage = sum(session["size"] for session in kept)
+            if self.quota_bytes > 0 and usage > self.quota_bytes:
+                candidates = sorted(
+                    (
+                        session for session in kept
+                        if not session["pinned"] and
+                        now - session["modified"] > self.min_age
+                    ),
+                    key=lambda session: session["last_viewed"]
+                )
+                for session in candidates:
+                    if usage <= self.quota_bytes:
+                        break
+                    if self._delete(session):
+                        kept.remove(session)
+                        usage -= session["size"]
+
+            self.last_run = now
+            self.usage_bytes = usage
+            self.sessions = len(kept)
+            self.pinned = sum(1 for session in kept if session["pinned"])
+
+    def _loop(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Error applying screenshot retention: {e}")
+            if self._stop.wait(self.interval):
+                break
+
+    def start(self):
+        """Run the retention pass in a background thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def pin(self, name, pinned=True):
+        """Pin or unpin a session directory, returning False if it is unknown"""
+        session_dir = self.root / name
+        if not session_dir.is_dir() or session_dir.parent != self.root:
+            return False
+        marker = session_dir / PINNED_MARKER
+        if pinned:
+            marker.touch()
+        elif marker.exists():
+            marker.unlink()
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "usage_bytes": self.usage_bytes,
+                "quota_bytes": self.quota_bytes,
+                "max_age_seconds": self.max_age,
+                "sessions": self.sessions,
+                "pinned": self.pinned,
+                "evicted_sessions": self.evicted_sessions,
+                "evicted_bytes": self.evicted_bytes,
+                "last_run": self.last_run
+            }
+
+
+retention_manager = RetentionManager(
+    SCREENSHOTS_DIR,
+    SCREENSHOT_QUOTA_MB * 1024 * 1024,
+    SCREENSHOT_MAX_AGE_DAYS * 86400,
+    RETENTION_INTERVAL_SECONDS,
+    RETENTION_MIN_AGE_SECONDS
+)
+
+
+class SessionStateStore:
+    """Named cookie and localStorage snapshots reused across browses.
+
+    Each name maps to a JSON file holding, per host, the cookies and
+    localStorage captured at the end of a browse. Restoring loads a tiny
+    same-origin URL first, because WebDriver can only set cookies and
+    storage for the page it is on. Hosts saved longer than ``max_age``
+    ago, and cookies past their own expiry, are ignored.
+    """
+
+    NAME_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+    def __init__(self, state_dir, max_age):
+        self.state_dir = Path(state_dir)
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self.restored = 0
+        self.saved = 0
+
+    def validate(self, name):
+        if not isinstance(name, str) or not self.NAME_PATTERN.match(name):
+            raise BrowseError(
+                "session_state must be 1-64 letters, digits, '.', '_' or '-'",
+                status_code=400
+            )
+        return name
+
+    def _path(self, name):
+        return self.state_dir / f"{name}.json"
+
+    def load(self, name):
+        try:
+            return json.loads(self._path(name).read_text())
+        except (OSError, ValueError):
+            return {"name": name, "hosts": {}}
+
+    def restore(self, driver, url, name):
+        """Apply the saved state for ``url``'s host; True if anything was set"""
+        parts = urlsplit(url)
+        entry = self.load(name)["hosts"].get(parts.hostname or "")
+        if not entry or time.time() - entry["saved_at"] > self.max_age:
+            return False
+        now = time.time()
+        cookies = [
+            cookie for cookie in entry["cookies"]
+            if not cookie.get("expiry") or cookie["expiry"] > now
+        ]
+        with timed("session_state"):
+            driver.get(f"{parts.scheme}://{parts.netloc}/robots.txt")
+            for cookie in cookies:
+                try:
+                    driver.add_cookie(cookie)
+                except Exception as e:
+                    print(f"Skipping cookie {cookie.get('name')} for {name}: {e}")
+            if entry.get("local_storage"):
+                driver.execute_script(
+                    "var items = arguments[0];"
+                    "for (var key in items) { localStorage.setItem(key, items[key]); }",
+                    entry["local_storage"]
+                )
+        with self._lock:
+            self.restored += 1
+        return True
+
+    def save(self, driver, name, url=None):
+        """Capture cookies and localStorage of the page the driver is on.
+
+        The state is filed under the host of ``url``, the address the
+        browse asked for, so the next ``restore`` for that URL finds it
+        even after a redirect. When the final page is on another host it
+        is filed under that host as well.
+        """
+        hosts = {
+            host for host in (
+                urlsplit(url).hostname if url else None,
+                urlsplit(driver.current_url).hostname
+            ) if host
+        }
+        if not hosts:
+            return
+        with timed("session_state"):
+            cookies = driver.get_cookies()
+            try:
+                local_storage = driver.execute_script(
+                    "var items = {};"
+                    "for (var i = 0; i < localStorage.length; i++) {"
+                    "  var key = localStorage.key(i); items[key] = localStorage.getItem(key);"
+                    "}"
+                    "return items;"
+                )
+            except Exception:
+                local_storage = {}
+        with self._lock:
+            state = self.load(name)
+            cutoff = time.time() - self.max_age
+            state["hosts"] = {
+                other: entry for other, entry in state["hosts"].items()
+                if entry["saved_at"] >= cutoff
+            }
+            for host in hosts:
+                state["hosts"][host] = {
+                    "cookies": cookies,
+                    "local_storage": local_storage,
+                    "saved_at": time.time()
+                }
+            state["updated_at"] = time.time()
+            # Write then rename so a concurrent reader never sees half a file
+            temporary = self._path(name).with_suffix(".tmp")
+            temporary.write_text(json.dumps(state))
+            temporary.replace(self._path(name))
+            self.saved += 1
+
+    def list(self):
+        states = []
+        for path in sorted(self.state_dir.glob("*.json")):
+            state = self.load(path.stem)
+            states.append({
+                "name": path.stem,
+                "updated_at": state.get("updated_at"),
+                "hosts": {
+                    host: {
+                        "cookies": len(entry["cookies"]),
+                        "local_storage": len(entry.get("local_storage") or {}),
+                        "saved_at": entry["saved_at"]
+                    }
+                    for host, entry in state["hosts"].items()
+                }
+            })
+        return states
+
+    def delete(self, name):
+        try:
+            self._path(name).unlink()
+            return True
+        except OSError:
+            return False
+
+
+session_states = SessionStateStore(
+    SESSION_STATE_DIR, SESSION_STATE_MAX_AGE_DAYS * 86400
+)
+
+
+@contextmanager
+def session_state(pooled, url, options):
+    """Restore the requested session state before a browse and save it after.
+
+    The state is saved only if the browse finishes without an error, so a
+    failed page never overwrites good cookies. If navigate() swaps in a
+    replacement driver, the state is restored onto it before the retry;
+    when that is not possible the state is not saved either.
+    """
+    name = options.get("session_state")
+    if not name:
+        yield
+        return
+    session_states.validate(name)
+    # The driver holding the restored state; a fresh replacement does not
+    holder = {"driver": pooled.driver}
+
+    def restore(driver):
+        try:
+            session_states.restore(driver, url, name)
+            holder["driver"] = driver
+        except Exception as e:
+            print(f"Could not restore session state {name} for {url}: {e}")
+
+    if url:
+        restore(pooled.driver)
+        pooled.restore_state = restore
+    try:
+        yield
+    finally:
+        pooled.restore_state = None
+    if holder["driver"] is not pooled.driver:
+        print(f"Not saving session state {name}: driver {pooled.id} was replaced without it")
+    elif options.get("save_session_state", True):
+        try:
+            session_states.save(pooled.driver, name, url)
+        except Exception as e:
+            print(f"Could not save session state {name}: {e}")
+
+
+def result_files_exist(result_data):
+    """Whether every screenshot referenced by a result is still on disk"""
+    paths = list(result_data.get("screenshots") or [])
+    if result_data.get("screenshot"):
+        paths.append(result_data["screenshot"])
+    if result_data.get("recording"):
+        paths.append(result_data["recording"]["path"])
+    return all((DATA_DIR / path).exists() for path in paths)
+
+
+class ResultCache:
+    """LRU cache of browse results with an on-disk tier.
+
+    Entries are keyed by normalized URL, mode and the options that change
+    the result. Entries younger than ``ttl`` are served directly; older
+    ones are served only if the site confirms via ETag/Last-Modified that
+    the page has not changed. A result's outline snapshot is stored with
+    the entry, so its ``snapshot_id`` still pages after the in-memory
+    outline store has dropped it or the service restarted.
+    """
+
+    IGNORED_OPTIONS = ("url", "cache")
+
+    def __init__(self, max_entries, ttl, cache_dir, disk_max_age):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.disk_max_age = disk_max_age
+        self.cache_dir.mkdir(exist_ok=True)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def key(self, url, options):
+        options = options or {}
+        relevant = {
+            name: value for name, value in options.items()
+            if name not in self.IGNORED_OPTIONS
+        }
+        relevant.setdefault("mode", "visual")
+        raw = json.dumps(
+            {"url": normalize_url(url), "options": relevant}, sort_keys=True
+        )
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key):
+        return self.cache_dir / f"{key}.json"
+
+    def _load(self, key):
+        """Look an entry up in memory, then on disk"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        try:
+            entry = json.loads(self._disk_path(key).read_text())
+        except (OSError, ValueError):
+            return None
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _revalidate(self, entry):
+        """Ask the site whether a stale entry is still current"""
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        if not headers:
+            return False
+        try:
+            response = requests.head(
+                entry["url"], headers=headers, timeout=5, allow_redirects=True
+            )
+        except requests.RequestException:
+            return False
+        return response.status_code == 304
+
+    @staticmethod
+    def _outline_id(result_data):
+        outline = result_data.get("outline")
+        return outline.get("snapshot_id") if isinstance(outline, dict) else None
+
+    def _restore_outline(self, entry):
+        """Put the entry's outline back in the outline store if it was
+        dropped; False if the entry cannot serve its snapshot_id"""
+        snapshot_id = self._outline_id(entry["result"])
+        if snapshot_id is None or outline_store.get(snapshot_id) is not None:
+            return True
+        if entry.get("outline") is None:
+            return False
+        outline_store.put(entry["outline"], snapshot_id)
+        return True
+
+    def get(self, key):
+        """Return a cached result, or None on a miss"""
+        entry = self._load(key)
+        if entry is not None and not (
+                result_files_exist(entry["result"]) and self._restore_outline(entry)):
+            self.discard(key)
+            entry = None
+
+        if entry is not None and time.time() - entry["stored_at"] > self.ttl:
+            if self._revalidate(entry):
+                entry["stored_at"] = time.time()
+                self._write(key, entry)
+                with self._lock:
+                    self.revalidated += 1
+            else:
+                entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        result_data = dict(entry["result"])
+        for path in result_data.get("screenshots") or []:
+            mark_session_viewed(path)
+        if result_data.get("recording"):
+            mark_session_viewed(result_data["recording"]["path"])
+        result_data["cached"] = True
+        result_data["cached_at"] = entry["stored_at"]
+        return result_data
+
+    def put(self, key, url, result_data):
+        """Store a result and fetch its validators in the background"""
+        snapshot_id = self._outline_id(result_data)
+        entry = {
+            "url": url,
+            "result": result_data,
+            "outline": outline_store.get(snapshot_id) if snapshot_id else None,
+            "stored_at": time.time(),
+            "etag": None,
+            "last_modified": None
+        }
+        self._remember(key, entry)
+        with self._lock:
+            self.stores += 1
+        threading.Thread(
+            target=self._store_validators, args=(key, entry), daemon=True
+        ).start()
+
+    def _store_validators(self, key, entry):
+        try:
+            response = requests.head(entry["url"], timeout=5, allow_redirects=True)
+            entry["etag"] = response.headers.get("ETag")
+            entry["last_modified"] = response.headers.get("Last-Modified")
+        except requests.RequestException:
+            pass
+        self._write(key, entry)
+        self._prune_disk()
+
+    def _write(self, key, entry):
+        try:
+            self._disk_path(key).write_text(json.dumps(entry))
+        except OSError as e:
+            print(f"Error writing cache entry {key}: {e}")
+
+    def _prune_disk(self):
+        """Delete on-disk entries older than the disk tier's maximum age"""
+        cutoff = time.time() - self.disk_max_age
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        try:
+            self._disk_path(key).unlink()
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidated": self.revalidated,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None
+            }
+
+
+result_cache = ResultCache(
+    CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS, CACHE_DIR, CACHE_DISK_MAX_AGE_SECONDS
+)
+
+
+def recording_steps(recording):
+    """Step events for a walk whose screenshots were dropped for its recording.
+
+    Each step points at its ``frame`` in the recording instead of a
+    screenshot file.
+    """
+    return [
+        {
+            "index": step["index"],
+            "description": step["description"],
+            "cursor_position": step["cursor_position"],
+            "interaction": step["interaction"],
+            "screenshot": None,
+            "patch": None,
+            "frame": step["frame"]
+        }
+        for step in recording["steps"]
+    ]
+
+
+def replay_cached_steps(result_data, listener):
+    """Feed a cached visual result to a step listener as if it were live"""
+    screenshots = result_data.get("screenshots") or []
+    if not screenshots and result_data.get("recording"):
+        for step in recording_steps(result_data["recording"]):
+            listener(step)
+        return
+    for index, screenshot in enumerate(screenshots):
+        listener({
+            "index": index,
+            "description": result_data["descriptions"][index],
+            "cursor_position": result_data["cursor_positions"][index],
+            "interaction": result_data["interactions"][index],
+            "screenshot": screenshot,
+            "patch": (result_data.get("patches") or [None] * len(screenshots))[index]
+        })
+
+
+def perform_browse(url, options=None, listener=None, cancel_event=None):
+    """Run a browse in the requested mode, serving repeats from the cache"""
+    options = options or {}
+    mode = "plan" if options.get("steps") is not None else options.get("mode", "visual")
+    timer = PhaseTimer()
+    request_context.timer = timer
+    outcome = "error"
+    try:
+        # Plans click and type, so they always run against the live page
+        use_cache = options.get("cache", True) and mode != "plan"
+        if use_cache:
+            key = result_cache.key(url, options)
+            with timed("cache"):
+                cached = result_cache.get(key)
+            if cached is not None:
+                if listener is not None:
+                    replay_cached_steps(cached, listener)
+                cached["timings"] = timer.summary()
+                outcome = "cached"
+                return cached
+
+        result_data = run_browse(url, options, listener, cancel_event)
+        result_data["timings"] = timer.summary()
+        if use_cache:
+            result_cache.put(key, url, result_data)
+        outcome = "ok"
+        return result_data
+    except BrowseCancelled:
+        outcome = "cancelled"
+        raise
+    finally:
+        request_context.timer = None
+        metrics.inc("browser_requests_total", {"mode": mode, "outcome": outcome})
+        metrics.observe(
+            "browser_request_seconds", time.monotonic() - timer.started, {"mode": mode}
+        )
+
+
+def run_browse(url, options=None, listener=None, cancel_event=None):
+    """Run a browse in the requested mode and return the result data"""
+    options = options or {}
+    if options.get("steps") is not None:
+        return perform_plan(url, options, listener, cancel_event)
+    mode = options.get("mode", "visual")
+    if mode == "extract":
+        return perform_extract(url, options)
+    if mode != "visual":
+        raise BrowseError(f"Unknown browse mode: {mode}", status_code=400)
+    recording_format(options)
+
+    with get_pool(False, options.get("profile")).checkout() as pooled:
+        with session_state(pooled, url, options):
+            result_data, recorder = run_visual_walk(
+                pooled, url, options, listener, cancel_event
+            )
+    # Frames finish encoding after the driver is back in the pool
+    return finish_visual_result(result_data, recorder, options)
+
+
+@app.route('/browse', methods=['POST'])
+def browse_website():
+    """Browse a website with visual feedback"""
+    data = request.json
+    default_url = None if data.get('steps') else 'https://www.example.com'
+    url = data.get('url', default_url)
+    
+    try:
+        # Runs on the job workers so admission control and the request
+        # timeout apply
+        job = job_manager.submit(url, data)
+        return jsonify(job_manager.wait(job, BROWSE_REQUEST_TIMEOUT))
+    except BrowseError as e:
+        return error_response(e, url)
+    except Exception as e:
+        return jsonify({
+            "error": f"Error browsing website: {str(e)}",
+            "url": url
+        }), 500
+
+class BrowseJob:
+    """A browse request running in the background on the job workers"""
+
+    def __init__(self, job_id, url, options, listener=None):
+        self.id = job_id
+        self.url = url
+        self.options = options
+        self.listener = listener
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.error_status = None
+        self.retry_after = None
+        self.steps = []
+        self.cancel_event = threading.Event()
+        self.future = None
+        self._lock = threading.Lock()
+
+    def add_step(self, step):
+        with self._lock:
+            self.steps.append(step)
+        if self.listener is not None:
+            self.listener(step)
+
+    def options_for_run(self):
+        """The browse options, keeping frames a live listener has been sent"""
+        if self.listener is not None and not self.options.get("keep_frames", True):
+            # Streamed step events point the client at the screenshot files
+            return dict(self.options, keep_frames=True)
+        return self.options
+
+    def drop_step_frames(self):
+        """Point polled steps into the recording once their screenshots are gone"""
+        result = self.result or {}
+        if result.get("recording") and not result.get("screenshots"):
+            with self._lock:
+                self.steps = recording_steps(result["recording"])
+
+    def to_dict(self):
+        with self._lock:
+            steps = sorted(self.steps, key=lambda step: step["index"])
+        return {
+            "job_id": self.id,
+            "url": self.url,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "steps": steps,
+            "result": self.result,
+            "error": self.error,
+            "error_status": self.error_status,
+            "retry_after": self.retry_after
+        }
+
+
+def job_lane(options):
+    """Which job workers run a browse: "extract" for headless work, else "visual" """
+    if options.get("steps") is not None:
+        return "extract" if options.get("headless") else "visual"
+    return "extract" if options.get("mode") == "extract" else "visual"
+
+
+class JobManager:
+    """Runs browse jobs on worker pools and keeps them for polling.
+
+    ``workers`` maps each lane (see ``job_lane``) to its number of worker
+    threads, so jobs for one driver pool never wait behind another's. At
+    most ``max_active`` jobs may be queued or running in total; further
+    submits raise OverloadedError with a Retry-After estimated from recent
+    job durations. Once draining starts, no new jobs are accepted.
+    """
+
+    FINISHED = ("completed", "failed", "cancelled")
+
+    def __init__(self, workers, retention_seconds, max_active):
+        self.lane_workers = {lane: max(1, count) for lane, count in workers.items()}
+        self.workers = sum(self.lane_workers.values())
+        self.retention_seconds = retention_seconds
+        self.max_active = max(1, max_active)
+        self._executors = {
+            lane: ThreadPoolExecutor(
+                max_workers=count, thread_name_prefix=f"browse-job-{lane}"
+            )
+            for lane, count in self.lane_workers.items()
+        }
+        self._jobs = {}
+        self._lock = threading.Condition()
+        self._active = 0
+        self._average_seconds = 10.0
+        self._draining_since = None
+        self.rejected = 0
+
+    def retry_after(self):
+        """Seconds until a worker is likely free; caller holds the lock"""
+        backlog = max(1, self._active - self.workers + 1)
+        estimate = self._average_seconds * backlog / self.workers
+        return int(min(60, max(1, round(estimate))))
+
+    def submit(self, url, options, listener=None):
+        """Queue a browse job and return it immediately"""
+        job = BrowseJob(uuid.uuid4().hex, url, options, listener)
+        with self._lock:
+            if self._draining_since is not None:
+                self.rejected += 1
+                raise OverloadedError(
+                    "Browser service is shutting down",
+                    retry_after=int(DRAIN_TIMEOUT), status_code=503
+                )
+            if self._active >= self.max_active:
+                self.rejected += 1
+                raise OverloadedError(
+                    f"Browser service is at capacity ({self._active} browses in progress)",
+                    retry_after=self.retry_after()
+                )
+            self._prune()
+            self._jobs[job.id] = job
+            self._active += 1
+        job.future = self._executors[job_lane(options)].submit(self._run, job)
+        job.future.add_done_callback(lambda future: self._finished(job))
+        return job
+
+    def wait(self, job, timeout):
+        """Wait for a job and return its result, cancelling it on timeout"""
+        try:
+            job.future.result(timeout)
+        except FutureTimeoutError:
+            self.cancel(job.id)
+            raise BrowseError(
+                f"Browse did not finish within {timeout:g}s", status_code=504
+            )
+        except CancelledError:
+            pass
+        if job.status == "completed":
+            return job.result
+        if job.status == "cancelled":
+            raise BrowseCancelled()
+        raise BrowseError(
+            job.error, status_code=job.error_status or 500,
+            retry_after=job.retry_after
+        )
+
+    def _finished(self, job):
+        with self._lock:
+            self._active -= 1
+            if job.started_at and job.finished_at:
+                # Moving average of job duration for Retry-After estimates
+                duration = job.finished_at - job.started_at
+                self._average_seconds = 0.8 * self._average_seconds + 0.2 * duration
+            self._lock.notify_all()
+
+    def start_draining(self):
+        """Stop accepting jobs; running and queued jobs carry on"""
+        with self._lock:
+            if self._draining_since is None:
+                self._draining_since = time.monotonic()
+                print(f"Draining browser service, {self._active} jobs in progress")
+
+    def drain(self, timeout):
+        """Wait up to ``timeout`` seconds after draining started for jobs to
+        finish, then cancel whatever is left"""
+        self.start_draining()
+        with self._lock:
+            deadline = self._draining_since + timeout
+            while self._active and time.monotonic() < deadline:
+                self._lock.wait(deadline - time.monotonic())
+            leftover = [
+                job for job in self._jobs.values() if job.status not in self.FINISHED
+            ]
+        for job in leftover:
+            print(f"Cancelling job {job.id} at shutdown")
+            self.cancel(job.id)
+        for executor in self._executors.values():
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a job, returning it or None if it does not exist"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            # Never started, so the worker will not update it
+            job.status = "cancelled"
+            job.finished_at = time.time()
+        return job
+
+    def _run(self, job):
+        if job.cancel_event.is_set():
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            return
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = perform_browse(
+                job.url, job.options_for_run(), job.add_step, job.cancel_event
+            )
+            job.drop_step_frames()
+            job.status = "completed"
+        except BrowseCancelled:
+            job.status = "cancelled"
+        except BrowseError as e:
+            job.error = e.message
+            job.error_status = e.status_code
+            job.retry_after = e.retry_after
+            job.status = "failed"
+        except Exception as e:
+            job.error = f"Error browsing website: {str(e)}"
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        """Forget finished jobs past their retention; caller holds the lock"""
+        cutoff = time.time() - self.retention_seconds
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.status in self.FINISHED and job.finished_at and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return counts
+
+    def admission(self):
+        with self._lock:
+            return {
+                "active": self._active,
+                "max_active": self.max_active,
+                "workers": self.lane_workers,
+                "rejected": self.rejected,
+                "draining": self._draining_since is not None,
+                "average_job_seconds": round(self._average_seconds, 2)
+            }
+
+
+job_manager = JobManager(
+    {"visual": JOB_WORKERS, "extract": EXTRACT_JOB_WORKERS},
+    JOB_RETENTION_SECONDS, MAX_ACTIVE_JOBS
+)
+
+
+def error_response(error, url=None):
+    """JSON error body for a BrowseError, with Retry-After when it has one"""
+    body = {"error": error.message}
+    if url is not None:
+        body["url"] = url
+    if error.retry_after is not None:
+        body["retry_after"] = error.retry_after
+    response = jsonify(body)
+    response.status_code = error.status_code
+    if error.retry_after is not None:
+        response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+
+def start_service():
+    """Warm the driver pools and start background maintenance"""
+    driver_pool.start()
+    extract_pool.start()
+    retention_manager.start()
+    driver_watchdog.start()
+
+
+def drain_service(timeout=DRAIN_TIMEOUT):
+    """Let in-flight jobs finish, then quit every driver"""
+    job_manager.drain(timeout)
+    driver_watchdog.stop()
+    for pool in all_pools():
+        pool.shutdown()
+    screenshot_encoder.shutdown()
+    print("Browser service drained")
+
+
+@app.route('/outline/<snapshot_id>', methods=['GET'])
+def get_outline(snapshot_id):
+    """Return another page of a captured outline, starting at ``cursor``"""
+    snapshot = outline_store.get(snapshot_id)
+    if snapshot is None:
+        return jsonify({
+            "error": "Unknown or expired outline; browse the page again",
+            "snapshot_id": snapshot_id
+        }), 404
+    page = outline_page(
+        snapshot["items"],
+        request.args.get("cursor", 0, type=int),
+        request.args.get("budget", OUTLINE_BYTE_BUDGET, type=int)
+    )
+    page.update({
+        "snapshot_id": snapshot_id,
+        "truncated": snapshot["truncated"],
+        "title": snapshot["title"],
+        "final_url": snapshot["final_url"]
+    })
+    return jsonify(page)
+
+
+@app.route('/cache', methods=['DELETE'])
+def clear_cache():
+    """Drop every cached browse result"""
+    result_cache.clear()
+    return jsonify({"status": "cleared", "cache": result_cache.stats()})
+
+
+@app.route('/retention', methods=['GET'])
+def retention_stats():
+    """Report screenshot disk usage and eviction counts"""
+    return jsonify(retention_manager.stats())
+
+
+@app.route('/retention/run', methods=['POST'])
+def run_retention():
+    """Apply the screenshot quota and age limit immediately"""
+    retention_manager.run_once()
+    return jsonify(retention_manager.stats())
+
+
+@app.route('/retention/pin/<name>', methods=['POST', 'DELETE'])
+def pin_session(name):
+    """Pin a screenshot session so retention never deletes it, or unpin it"""
+    pinned = request.method == 'POST'
+    if not retention_manager.pin(name, pinned):
+        return jsonify({"error": "Unknown screenshot session", "session": name}), 404
+    return jsonify({"session": name, "pinned": pinned})
+
+
+@app.route('/session_state', methods=['GET'])
+def list_session_states():
+    """List saved session states with per-host cookie and storage counts"""
+    return jsonify({"session_states": session_states.list()})
+
+
+@app.route('/session_state/<name>', methods=['DELETE'])
+def delete_session_state(name):
+    """Forget a saved session state so the next browse starts clean"""
+    if not SessionStateStore.NAME_PATTERN.match(name) or not session_states.delete(name):
+        return jsonify({"error": "Unknown session state", "session_state": name}), 404
+    return jsonify({"session_state": name, "deleted": True})
+
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Start a browse job in the background and return its id"""
+    data = request.json or {}
+    default_url = None if data.get('steps') else 'https://www.example.com'
+    url = data.get('url', default_url)
+    try:
+        job = job_manager.submit(url, data)
+    except BrowseError as e:
+        return error_response(e, url)
+    return jsonify({"job_id": job.id, "status": job.status, "url": url}), 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Return the status and the steps captured so far for a job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job", "job_id": job_id}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued or running job"""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job", "job_id": job_id}), 404
+    return jsonify({"job_id": job.id, "status": job.status})
+
+
+@app.route('/browse/stream', methods=['POST'])
+def browse_website_stream():
+    """Browse a website, streaming each step as NDJSON as soon as it is captured.
+
+    Emits ``step`` events while the walk runs, then a single ``result`` or
+    ``error`` event. Closing the connection cancels the walk.
+    """
+    data = request.json or {}
+    default_url = None if data.get('steps') else 'https://www.example.com'
+    url = data.get('url', default_url)
+    events = queue.Queue()
+    try:
+        job = job_manager.submit(
+            url, data, lambda step: events.put({"type": "step", "step": step})
+        )
+    except BrowseError as e:
+        return error_response(e, url)
+    job.future.add_done_callback(lambda future: events.put(None))
+
+    def generate():
+        try:
+            yield json.dumps({"type": "started", "job_id": job.id, "url": url}) + "\n"
+            while True:
+                try:
+                    event = events.get(timeout=STREAM_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    # Keep proxies and client read timeouts from closing the stream
+                    yield json.dumps({"type": "heartbeat"}) + "\n"
+                    continue
+                if event is None:
+                    break
+                yield json.dumps(event) + "\n"
+
+            if job.status == "completed":
+                yield json.dumps({"type": "result", "result": job.result}) + "\n"
+            else:
+                yield json.dumps({
+                    "type": "error",
+                    "error": job.error or f"Browse job was {job.status}",
+                    "url": url
+                }) + "\n"
+        finally:
+            # Stop the walk if the client went away early
+            if job.status not in JobManager.FINISHED:
+                job_manager.cancel(job.id)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
+@app.route('/browse/batch', methods=['POST'])
+def browse_batch():
+    """Browse several URLs in parallel, streaming each result as NDJSON.
+
+    The body holds ``urls`` (strings, or objects with a ``url`` and their
+    own options), shared ``options`` and an optional ``deadline`` in
+    seconds for the whole batch. Emits a ``result`` or ``error`` event per
+    URL as soon as it finishes, in completion order, then ``done``.
+    Anything still running at the deadline is cancelled.
+    """
+    data = request.json or {}
+    items = data.get('urls') or []
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "urls must be a non-empty list"}), 400
+    if len(items) > BATCH_MAX_URLS:
+        return jsonify({
+            "error": f"Batches are limited to {BATCH_MAX_URLS} URLs"
+        }), 400
+    shared = data.get('options') or {}
+    if not isinstance(shared, dict):
+        return jsonify({"error": "options must be an object"}), 400
+    try:
+        deadline_seconds = float(data.get('deadline', BATCH_DEADLINE_SECONDS))
+    except (TypeError, ValueError):
+        deadline_seconds = None
+    if deadline_seconds is None or not deadline_seconds > 0:
+        return jsonify({"error": "deadline must be a positive number of seconds"}), 400
+    deadline_seconds = min(deadline_seconds, BROWSE_REQUEST_TIMEOUT)
+
+    # Check every item before starting any, so a bad entry fails the request
+    # instead of surfacing as an error from inside its job
+    requests_to_run = []
+    for index, item in enumerate(items):
+        if isinstance(item, dict):
+            url, options = item.get('url'), dict(shared, **item)
+            options.pop('url', None)
+        else:
+            url, options = item, dict(shared)
+        # A plan may leave out the url and open its page with a navigate step
+        plan_without_url = url is None and options.get('steps')
+        if not plan_without_url and (not isinstance(url, str) or not url.strip()):
+            return jsonify({
+                "error": "each item in urls must be a URL string or an object with a url",
+                "index": index
+            }), 400
+        requests_to_run.append((url, options))
+
+    started = time.monotonic()
+    deadline = started + deadline_seconds
+
+    events = queue.Queue()
+    jobs = {}
+    for index, (url, options) in enumerate(requests_to_run):
+        try:
+            job = job_manager.submit(url, options)
+        except BrowseError as e:
+            # Over capacity: report this URL and keep the ones already admitted
+            events.put({
+                "type": "error", "index": index, "url": url,
+                "error": e.message, "retry_after": e.retry_after
+            })
+            continue
+        jobs[index] = job
+        job.future.add_done_callback(
+            lambda future, index=index, job=job: events.put((index, job))
+        )
+
+    def generate():
+        pending = len(items)
+        completed = 0
+        try:
+            yield json.dumps({
+                "type": "started",
+                "urls": len(items),
+                "deadline_seconds": deadline_seconds
+            }) + "\n"
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event = events.get(timeout=min(remaining, STREAM_HEARTBEAT_SECONDS))
+                except queue.Empty:
+                    if deadline - time.monotonic() > 0:
+                        yield json.dumps({"type": "heartbeat"}) + "\n"
+                    continue
+                pending -= 1
+                if isinstance(event, dict):
+                    yield json.dumps(event) + "\n"
+                    continue
+                index, job = event
+                del jobs[index]
+                if job.status == "completed":
+                    completed += 1
+                    yield json.dumps({
+                        "type": "result", "index": index, "url": job.url,
+                        "result": job.result
+                    }) + "\n"
+                else:
+                    yield json.dumps({
+                        "type": "error", "index": index, "url": job.url,
+                        "error": job.error or f"Browse job was {job.status}",
+                        "retry_after": job.retry_after
+                    }) + "\n"
+
+            for index, job in sorted(jobs.items()):
+                yield json.dumps({
+                    "type": "error", "index": index, "url": job.url,
+                    "error": f"Batch deadline of {deadline_seconds:g}s exceeded"
+                }) + "\n"
+            yield json.dumps({
+                "type": "done",
+                "completed": completed,
+                "failed": len(items) - completed,
+                "elapsed_ms": round((time.monotonic() - started) * 1000, 1)
+            }) + "\n"
+        finally:
+            # Deadline passed or the client went away: free the drivers
+            for job in list(jobs.values()):
+                if job.status not in JobManager.FINISHED:
+                    job_manager.cancel(job.id)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5002) 
\ No newline at end of file
+    # Development server; production runs under gunicorn (gunicorn.conf.py)
+    start_service()
+    app.run(host='0.0.0.0', port=5002, threaded=True)
@@ -0,0 +1,54 @@
+"""Gunicorn settings for the browser service.
+
+The driver pools, jobs and result cache live in process memory, so the
+service runs as one worker whose thread count follows the pool sizes.
+Run with: gunicorn -c gunicorn.conf.py browser_service:app
+"""
+import os
+import signal
+
+pool_size = int(os.environ.get("BROWSER_POOL_SIZE", "2"))
+extract_pool_size = int(os.environ.get("BROWSER_EXTRACT_POOL_SIZE", "2"))
+max_waiters = int(os.environ.get("BROWSER_POOL_MAX_WAITERS", "8"))
+max_active_jobs = int(os.environ.get(
+    "BROWSER_MAX_ACTIVE_JOBS", str(pool_size + extract_pool_size + max_waiters)
+))
+drain_timeout = float(os.environ.get("BROWSER_DRAIN_TIMEOUT", "60"))
+
+bind = "0.0.0.0:5002"
+workers = 1
+worker_class = "gthread"
+# One thread per admitted browse (visual and extract jobs share the
+# admission limit) plus headroom for job polling, /health and /metrics
+threads = int(os.environ.get(
+    "BROWSER_SERVER_THREADS", str(max_active_jobs + 8)
+))
+# Connections waiting to be accepted; admission control answers the rest
+backlog = 64
+# Worker heartbeat timeout; a single request is bounded by BROWSER_REQUEST_TIMEOUT
+timeout = int(os.environ.get("BROWSER_WORKER_TIMEOUT", "120"))
+keepalive = 5
+graceful_timeout = int(drain_timeout) + 10
+accesslog = "-"
+errorlog = "-"
+
+
+def post_worker_init(worker):
+    """Warm the pools and start refusing new jobs as soon as SIGTERM arrives"""
+    import browser_service
+
+    browser_service.start_service()
+    handle_exit = worker.handle_exit
+
+    def begin_drain(sig, frame):
+        browser_service.job_manager.start_draining()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, begin_drain)
+
+
+def worker_exit(server, worker):
+    """Give background jobs the rest of the drain timeout, then quit drivers"""
+    import browser_service
+
+    browser_service.drain_service(drain_timeout)
@@ -34,6 +34,13 @@ document.addEventListener('DOMContentLoaded', function() {
     let currentVisualIndex = 0;
     let visualPlayInterval = null;
     let visualInteractions = [];
+    // Partial frames (element region or changed tiles) per step, or null
+    let visualPatches = [];
+    // Animated recording of the whole walk, when the service produced one
+    let visualRecording = null;
+    let visualRecordingBlob = null;
+    let visualRecordingUrl = null;
+    let visualPlaybackTimers = [];
     
     // Global variables for visual monitoring
     let visualData = null;
@@ -147,6 +154,7 @@ document.addEventListener('DOMContentLoaded', function() {
         visualScreenshots = screenshots;
         visualDescriptions = descriptions || Array(screenshots.length).fill('');
         visualCursorPositions = cursorPositions || Array(screenshots.length).fill(null);
+        visualPatches = [];
         currentVisualIndex = 0;
         
         // Update UI
@@ -159,6 +167,47 @@ document.addEventListener('DOMContentLoaded', function() {
         window.scrollTo(0, document.body.scrollHeight);
     }
     
+    // Function to reveal the visual monitoring panel
+    function showVisualMonitor() {
+        const visualContent = document.getElementById('visual-content');
+        const visualPlaceholder = document.getElementById('visual-placeholder');
+        if (visualPlaceholder) visualPlaceholder.style.display = 'none';
+        if (visualContent) visualContent.style.display = 'block';
+    }
+    
+    // Function to clear visual browsing state before a new message
+    function resetVisualSteps() {
+        visualScreenshots = [];
+        visualDescriptions = [];
+        visualCursorPositions = [];
+        visualInteractions = [];
+        visualPatches = [];
+        currentVisualIndex = 0;
+        stopVisualPlayback();
+        visualRecording = null;
+        visualRecordingBlob = null;
+    }
+    
+    // Function to show a visual step as soon as the browser service streams it
+    function addVisualStep(step) {
+        // Follow the newest step unless the user is looking at an older one
+        const followLatest = visualScreenshots.length === 0 ||
+            currentVisualIndex === visualScreenshots.length - 1;
+        
+        visualScreenshots[step.index] = step.screenshot;
+        visualDescriptions[step.index] = step.description;
+        visualCursorPositions[step.index] = step.cursor_position;
+        visualInteractions[step.index] = step.interaction;
+        visualPatches[step.index] = step.patch || null;
+        
+        if (followLatest) {
+            currentVisualIndex = visualScreenshots.length - 1;
+        }
+        
+        showVisualMonitor();
+        updateVisualDisplay();
+    }
+    
     // Enhanced visual display functions
     function updateVisualDisplay() {
         // Update progress
@@ -169,9 +218,15 @@ document.addEventListener('DOMContentLoaded', function() {
         const interactionType = visualInteractions ? 
             (visualInteractions[currentVisualIndex] || 'none') : 'none';
         
-        // Update image
+        // Update image; streamed steps may still be missing, and the
+        // recording supplies the image while it plays
         const screenshotPath = visualScreenshots[currentVisualIndex];
-        visualPreview.src = `/${screenshotPath}`;
+        const playingRecording = visualPlaybackTimers.length > 0;
+        if (screenshotPath && !playingRecording) {
+            showCompositedStep(currentVisualIndex);
+        } else if (playingRecording) {
+            clearVisualPatches();
+        }
         
         // Update description
         visualDescription.textContent = visualDescriptions[currentVisualIndex] || '';
@@ -194,40 +249,121 @@ document.addEventListener('DOMContentLoaded', function() {
             // Show cursor with proper animation
             cursorIndicator.style.display = 'block';
             
-            // Position cursor based on provided coordinates
-            visualPreview.onload = function() {
-                const rect = visualPreview.getBoundingClientRect();
-                const imgWidth = visualPreview.naturalWidth || 1280;
-                const imgHeight = visualPreview.naturalHeight || 800;
-                const displayWidth = visualPreview.width;
-                const displayHeight = visualPreview.height;
-                
-                // Calculate position relative to displayed image size
-                const x = (cursorPos.x / imgWidth) * displayWidth;
-                const y = (cursorPos.y / imgHeight) * displayHeight;
-                
-                // Apply position
-                cursorIndicator.style.left = `${x}px`;
-                cursorIndicator.style.top = `${y}px`;
-                
-                // Add animation class based on interaction type
-                if (interactionType && interactionType.includes('typing')) {
-                    cursorIndicator.classList.add('cursor-typing');
-                } else if (interactionType && interactionType.includes('click')) {
-                    cursorIndicator.classList.add('cursor-clicking');
-                } else if (interactionType && interactionType.includes('hover')) {
-                    cursorIndicator.classList.add('cursor-hovering');
-                } else {
-                    cursorIndicator.classList.add('cursor-moving');
-                }
-            };
+            // Position cursor based on provided coordinates; the recording
+            // is already loaded, so place it straight away
+            if (playingRecording) {
+                placeCursor(cursorPos, interactionType);
+            } else {
+                visualPreview.onload = function() {
+                    placeCursor(cursorPos, interactionType);
+                };
+            }
         } else if (cursorIndicator) {
             cursorIndicator.style.display = 'none';
         }
     }
     
+    // Function to show a step whose frame may only cover part of the
+    // viewport: the last full frame is shown and the partial frames after
+    // it are laid over the preview at their recorded positions
+    function showCompositedStep(index) {
+        let base = index;
+        while (base > 0 && visualPatches[base]) {
+            base--;
+        }
+        clearVisualPatches();
+        if (!visualScreenshots[base]) return;
+        visualPreview.src = `/${visualScreenshots[base]}`;
+        
+        for (let i = base + 1; i <= index; i++) {
+            const patch = visualPatches[i];
+            if (!patch || !visualScreenshots[i]) continue;
+            const patchImage = document.createElement('img');
+            patchImage.className = 'visual-patch';
+            patchImage.src = `/${visualScreenshots[i]}`;
+            patchImage.style.left = `${patch.x / patch.frame_width * 100}%`;
+            patchImage.style.top = `${patch.y / patch.frame_height * 100}%`;
+            patchImage.style.width = `${patch.width / patch.frame_width * 100}%`;
+            patchImage.style.height = `${patch.height / patch.frame_height * 100}%`;
+            visualPreview.parentNode.appendChild(patchImage);
+        }
+    }
+    
+    // Function to remove partial frames laid over the preview
+    function clearVisualPatches() {
+        document.querySelectorAll('.visual-patch').forEach(function(patchImage) {
+            patchImage.remove();
+        });
+    }
+    
+    // Function to position the cursor indicator over the preview image
+    function placeCursor(cursorPos, interactionType) {
+        const imgWidth = visualPreview.naturalWidth || 1280;
+        const imgHeight = visualPreview.naturalHeight || 800;
+        const displayWidth = visualPreview.width;
+        const displayHeight = visualPreview.height;
+        
+        // Calculate position relative to displayed image size
+        const x = (cursorPos.x / imgWidth) * displayWidth;
+        const y = (cursorPos.y / imgHeight) * displayHeight;
+        
+        // Apply position
+        cursorIndicator.style.left = `${x}px`;
+        cursorIndicator.style.top = `${y}px`;
+        
+        // Add animation class based on interaction type
+        if (interactionType && interactionType.includes('typing')) {
+            cursorIndicator.classList.add('cursor-typing');
+        } else if (interactionType && interactionType.includes('click')) {
+            cursorIndicator.classList.add('cursor-clicking');
+        } else if (interactionType && interactionType.includes('hover')) {
+            cursorIndicator.classList.add('cursor-hovering');
+        } else {
+            cursorIndicator.classList.add('cursor-moving');
+        }
+    }
+    
+    // Function to play the walk's animated recording, following its frame
+    // index to keep the step counter, description and cursor in sync
+    async function playVisualRecording() {
+        if (!visualRecordingBlob) {
+            // Download the recording once; replays reuse the blob
+            const response = await fetch(`/${visualRecording.path}`);
+            if (!response.ok) throw new Error('Recording not available');
+            visualRecordingBlob = await response.blob();
+        }
+        if (visualRecordingUrl) URL.revokeObjectURL(visualRecordingUrl);
+        // A fresh object URL restarts the animation from its first frame
+        visualRecordingUrl = URL.createObjectURL(visualRecordingBlob);
+        
+        visualPlaybackTimers = visualRecording.steps.map(function(step) {
+            return setTimeout(function() {
+                currentVisualIndex = step.index;
+                updateVisualDisplay();
+            }, step.start_ms);
+        });
+        visualPlaybackTimers.push(setTimeout(function() {
+            stopVisualPlayback();
+            updateVisualDisplay();
+        }, visualRecording.duration_ms));
+        visualPreview.onload = null;
+        visualPreview.src = visualRecordingUrl;
+    }
+    
+    // Function to stop any running playback
+    function stopVisualPlayback() {
+        visualPlaybackTimers.forEach(clearTimeout);
+        visualPlaybackTimers = [];
+        if (visualPlayInterval) {
+            clearInterval(visualPlayInterval);
+            visualPlayInterval = null;
+        }
+        playVisualBtn.innerHTML = '<i class="bi bi-play-fill"></i>';
+    }
+    
     // Visual browsing navigation
     prevVisualBtn.addEventListener('click', function() {
+        stopVisualPlayback();
         if (currentVisualIndex > 0) {
             currentVisualIndex--;
             updateVisualDisplay();
@@ -235,6 +371,7 @@ document.addEventListener('DOMContentLoaded', function() {
     });
     
     nextVisualBtn.addEventListener('click', function() {
+        stopVisualPlayback();
         if (currentVisualIndex < visualScreenshots.length - 1) {
             currentVisualIndex++;
             updateVisualDisplay();
@@ -243,11 +380,16 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Play/pause visual browsing
     playVisualBtn.addEventListener('click', function() {
-        if (visualPlayInterval) {
-            // Stop playback
-            clearInterval(visualPlayInterval);
-            visualPlayInterval = null;
-            playVisualBtn.innerHTML = '<i class="bi bi-play-fill"></i>';
+        if (visualPlayInterval || visualPlaybackTimers.length > 0) {
+            // Stop playback and show the current step's still
+            stopVisualPlayback();
+            updateVisualDisplay();
+        } else if (visualRecording) {
+            playVisualBtn.innerHTML = '<i class="bi bi-pause-fill"></i>';
+            playVisualRecording().catch(function(error) {
+                console.error('Error playing recording:', error);
+                stopVisualPlayback();
+            });
         } else {
             // Start playback
             playVisualBtn.innerHTML = '<i class="bi bi-pause-fill"></i>';
@@ -290,9 +432,13 @@ document.addEventListener('DOMContentLoaded', function() {
         userInput.disabled = true;
         sendButton.disabled = true;
         
+        // Start a fresh visual session for this message
+        resetVisualSteps();
+        
         try {
-            // First, send the message to the server
-            const postResponse = await fetch('/api/chat/stream', {
+            // Send the message and read the streamed answer from the same
+            // request, one JSON event per line
+            const response = await fetch('/api/chat/ndjson', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
@@ -300,41 +446,35 @@ document.addEventListener('DOMContentLoaded', function() {
                 body: JSON.stringify({ message })
             });
             
-            if (!postResponse.ok) {
+            if (!response.ok || !response.body) {
                 throw new Error('Failed to send message');
             }
             
-            // Then establish SSE connection
-            const timestamp = new Date().getTime();
-            const eventSource = new EventSource(`/api/chat/stream?t=${timestamp}`);
-            
             let responseText = '';
             let agentUsed = 'System';
             let agentPath = null;
-            let retryCount = 0;
-            const maxRetries = 3;
-            let intentionallyClosed = false;
-            
-            // Listen for the close event
-            eventSource.addEventListener('close', function(event) {
-                console.log('Server requested connection close');
-                intentionallyClosed = true;
-                eventSource.close();
+            let finished = false;
+            
+            // Function to end the stream's UI state
+            function finishStreaming(enableInput) {
+                finished = true;
+                
+                // Remove typing indicator and streaming class
+                if (typingIndicator.parentNode) {
+                    typingIndicator.parentNode.removeChild(typingIndicator);
+                }
+                messageDiv.classList.remove('streaming-active');
                 
-                // Re-enable input if it's still disabled
-                if (userInput.disabled) {
+                // Check for enable_input flag (default to true if not specified)
+                if (enableInput !== false) {
+                    // Re-enable input
                     userInput.disabled = false;
                     sendButton.disabled = false;
                     userInput.focus();
                 }
-            });
+            }
             
-            eventSource.onmessage = function(event) {
-                // Reset retry count on successful message
-                retryCount = 0;
-                
-                const data = JSON.parse(event.data);
-                
+            function handleEvent(data) {
                 // Handle different types of events
                 if (data.status === 'started') {
                     console.log('Streaming started');
@@ -354,6 +494,25 @@ document.addEventListener('DOMContentLoaded', function() {
                         agentTag.appendChild(pathDisplay);
                     }
                 }
+                else if (data.type === 'visual_step') {
+                    // Show each browsing step as soon as it is captured
+                    addVisualStep(data);
+                }
+                else if (data.type === 'visual_data') {
+                    // The complete walk replaces the streamed steps
+                    visualScreenshots = data.screenshots || [];
+                    visualDescriptions = data.descriptions || [];
+                    visualCursorPositions = data.cursor_positions || [];
+                    visualInteractions = data.interactions || [];
+                    visualPatches = data.patches || [];
+                    visualRecording = data.recording || null;
+                    visualRecordingBlob = null;
+                    currentVisualIndex = Math.min(
+                        currentVisualIndex, Math.max(visualScreenshots.length - 1, 0)
+                    );
+                    showVisualMonitor();
+                    updateVisualDisplay();
+                }
                 else if (data.token) {
                     // Append token to response
                     responseText += data.token;
@@ -374,12 +533,6 @@ document.addEventListener('DOMContentLoaded', function() {
                     chatContainer.scrollTop = chatContainer.scrollHeight;
                 }
                 else if (data.status === 'completed') {
-                    // Remove typing indicator and streaming class
-                    if (typingIndicator.parentNode) {
-                        typingIndicator.parentNode.removeChild(typingIndicator);
-                    }
-                    messageDiv.classList.remove('streaming-active');
-                    
                     // Process any visual browsing data in the response
                     const hasVisualData = processVisualBrowsingData(responseText);
                     
@@ -388,88 +541,39 @@ document.addEventListener('DOMContentLoaded', function() {
                         hideVncViewer();
                     }
                     
-                    // Mark as intentionally closed to prevent auto-reconnect
-                    intentionallyClosed = true;
-                    
-                    // Close the connection
-                    eventSource.close();
-                    
-                    // Check for enable_input flag (default to true if not specified)
-                    if (data.enable_input !== false) {
-                        // Re-enable input
-                        userInput.disabled = false;
-                        sendButton.disabled = false;
-                        userInput.focus();
-                    }
+                    finishStreaming(data.enable_input);
                 }
                 else if (data.status === 'error') {
                     // Display error
                     contentDiv.innerHTML = `<div class="error-message">${data.message}</div>`;
-                    
-                    // Remove typing indicator and streaming class
-                    if (typingIndicator.parentNode) {
-                        typingIndicator.parentNode.removeChild(typingIndicator);
-                    }
-                    messageDiv.classList.remove('streaming-active');
-                    
-                    // Mark as intentionally closed to prevent auto-reconnect
-                    intentionallyClosed = true;
-                    
-                    // Close the connection
-                    eventSource.close();
-                    
-                    // Check for enable_input flag (default to true if not specified)
-                    if (data.enable_input !== false) {
-                        // Re-enable input
-                        userInput.disabled = false;
-                        sendButton.disabled = false;
-                        userInput.focus();
-                    }
+                    finishStreaming(data.enable_input);
                 }
-            };
+            }
             
-            eventSource.onerror = function(error) {
-                console.error('EventSource error:', error);
-                
-                // If we intentionally closed the connection, don't retry
-                if (intentionallyClosed) {
-                    console.log('Connection was intentionally closed, not retrying');
-                    return;
-                }
-                
-                // Implement retry logic
-                retryCount++;
-                
-                if (retryCount <= maxRetries) {
-                    console.log(`Retrying connection (${retryCount}/${maxRetries})...`);
-                    
-                    // Update message to show retry attempt
-                    contentDiv.innerHTML = `<div class="info-message">Connection issue. Retrying (${retryCount}/${maxRetries})...</div>`;
-                    
-                    // The EventSource will automatically try to reconnect
-                    return;
-                }
-                
-                // If we've exceeded max retries, show error and give up
-                contentDiv.innerHTML = '<div class="error-message">Connection error. Please try again.</div>';
-                
-                // Remove typing indicator and streaming class
-                if (typingIndicator.parentNode) {
-                    typingIndicator.parentNode.removeChild(typingIndicator);
-                }
-                messageDiv.classList.remove('streaming-active');
-                
-                // Mark as intentionally closed to prevent auto-reconnect
-                intentionallyClosed = true;
-                
-                // Close the connection
-                eventSource.close();
-                
-                // Re-enable input
-                userInput.disabled = false;
-                sendButton.disabled = false;
-                userInput.focus();
-            };
+            // Read the body as it arrives; a chunk can end mid-line, so keep
+            // the unfinished tail for the next chunk
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                lines.forEach(function(line) {
+                    if (line.trim()) {
+                        handleEvent(JSON.parse(line));
+                    }
+                });
+                if (done) break;
+            }
+            if (buffer.trim()) {
+                handleEvent(JSON.parse(buffer));
+            }
+            
+            if (!finished) {
+                throw new Error('Connection closed before the response finished');
+            }
             
         } catch (error) {
             console.error('Error in streaming:', error);
@@ -527,7 +631,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     fileDiv.className = 'file-item';
                     
                     // Check if it's a screenshot
-                    if (file.match(/screenshot_\d+\.png/) || file.match(/step_.*\.png/)) {
+                    if (file.match(/screenshot_\d+\.(png|jpg|webp)/) || file.match(/step_.*\.(png|jpg|webp)/)) {
                         fileDiv.innerHTML = `<a href="#" class="file-link screenshot-link" data-filename="${file}"><i class="bi bi-file-image"></i> ${file}</a>`;
                         
                         // Add event listener for screenshot preview
@@ -734,6 +838,7 @@ document.addEventListener('DOMContentLoaded', function() {
         visualDescriptions = result.descriptions || [];
         visualCursorPositions = result.cursor_positions || [];
         visualInteractions = result.interactions || [];
+        visualPatches = result.patches || [];
         currentVisualIndex = 0;
         
         // Create or update the visual browsing UI
@@ -966,8 +1071,10 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     // Modify the existing event source handler to handle visual data
-    function setupEventSource(timestamp) {
-        const eventSource = new EventSource(`/api/chat/stream?t=${timestamp}`);
+    function setupEventSource(channel) {
+        const eventSource = new EventSource(
+            `/api/chat/stream?channel=${encodeURIComponent(channel)}`
+        );
         
         eventSource.onmessage = function(event) {
             const data = JSON.parse(event.data);